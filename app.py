@@ -3,24 +3,109 @@ IVG Real Estate API Server
 Server Flask per l'applicazione di analisi immobili IVG
 """
 
-from flask import Flask, jsonify, request, send_from_directory
-from ivg_scraper import IVGScraper, calculate_match_score
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+from ivg_scraper import get_shared_scraper
 import os
+import time
+
+import compression
+import metrics
+import profiling
+import search_service
+from search_service import listing_index, search_cache
 
 app = Flask(__name__)
 
+# pagina del frontend servita dalla memoria, con ETag e varianti gzip/brotli precalcolate
+INDEX_PAGE = compression.StaticFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html'))
+
+search_service.start_background_crawler()
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+    if request.endpoint == 'search_properties':
+        # profilazione su richiesta: ?profile=1 oppure header X-IVG-Profile
+        profile = profiling.parse_mode(request.args.get('profile') or request.headers.get('X-IVG-Profile'))
+        if profile is not None:
+            g.profile, g.profile_token = profile, profiling.activate(profile)
+
+
+def _finish_profile():
+    profile = g.pop('profile', None)
+    if profile is None:
+        return None
+    timing = profile.server_timing()
+    paths = profiling.deactivate(profile, g.pop('profile_token'))
+    if paths:
+        print(f"[profile] {request.full_path} -> {', '.join(paths)}")
+    return timing
+
+
+# registrato per primo: eseguito per ultimo, il totale include compressione e header
+@app.after_request
+def server_timing(response):
+    timing = _finish_profile()
+    if timing is not None:
+        response.headers['Server-Timing'] = timing
+        response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+
+@app.teardown_request
+def release_profile(exc):
+    # richiesta terminata con un'eccezione non gestita: after_request non viene chiamato
+    _finish_profile()
+
+
 # CORS (opzionale, ma ok)
 @app.after_request
 def after_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unknown'
+    metrics.HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if 'request_started' in g:
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=endpoint)
+
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
+    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,DELETE,OPTIONS')
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli per le risposte JSON e HTML complete (lo streaming resta non compresso)"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.mimetype not in compression.COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    encoding = response.headers.get('Content-Encoding')
+    if encoding is None:
+        encoding = compression.choose_encoding(request.headers.get('Accept-Encoding'))
+        data = response.get_data()
+        if encoding is None or len(data) < compression.MIN_SIZE:
+            encoding = 'identity'
+        else:
+            with profiling.stage('compress'):
+                response.set_data(compression.compress(data, encoding))
+            response.headers['Content-Encoding'] = encoding
+    metrics.HTTP_RESPONSE_BYTES.inc(response.content_length or 0, encoding=encoding)
     return response
 
 
 @app.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
+    encoding = compression.choose_encoding(request.headers.get('Accept-Encoding'))
+    body, etag = INDEX_PAGE.get(encoding)
+    response = Response(body, mimetype='text/html')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    # il browser rivalida a ogni caricamento: 304 senza corpo se la pagina non è cambiata
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag, weak=True)
+    return response.make_conditional(request)
 
 
 @app.route('/api/health', methods=['GET'])
@@ -31,53 +116,155 @@ def health_check():
     })
 
 
+def _search_params():
+    """Filtri di ricerca dal body JSON (POST) o dalla query string (GET)"""
+    if request.method == 'POST':
+        return search_service.params_from_json(request.get_json(silent=True))
+    return search_service.params_from_query(request.args)
+
+
+def _compact_requested() -> bool:
+    """Risposta compatta con ?compact=1 oppure "compact": true nel body JSON"""
+    if search_service.wants_compact(request.args.get('compact')):
+        return True
+    data = request.get_json(silent=True) if request.method == 'POST' else None
+    return isinstance(data, dict) and search_service.wants_compact(data.get('compact'))
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/search', methods=['GET', 'POST'])
 def search_properties():
     try:
-        if request.method == 'POST':
-            data = request.get_json() or {}
-            max_price = data.get('max_price')
-            min_size = data.get('min_size')
-            location = data.get('location')
-            locazione = data.get('locazione')
-            stato = data.get('stato')
-        else:
-            max_price = request.args.get('max_price', type=float)
-            min_size = request.args.get('min_size', type=float)
-            location = request.args.get('location', type=str)
-            locazione = request.args.get('locazione', type=str)
-            stato = request.args.get('stato', type=str)
-
-        scraper = IVGScraper()
-
-        properties = scraper.search_properties(
-            max_price=max_price,
-            min_size=min_size,
-            location=location,
-            locazione=locazione,
-            stato=stato,
-        )
-
-        for prop in properties:
-            prop['matchScore'] = calculate_match_score(
-                prop, max_price, min_size, location, locazione=locazione, stato=stato
-            )
-
-        properties.sort(key=lambda x: x['matchScore'], reverse=True)
-
-        return jsonify({
-            'success': True,
-            'count': len(properties),
-            'properties': properties
-        })
+        params = _search_params()
+        invalid = search_service.params_error(params)
+        if invalid:
+            return jsonify(search_service.error_payload(ValueError(invalid))), 400
+        key = search_service.search_key(params)
+
+        def scrape():
+            if listing_index is not None:
+                return search_service.search_from_index(params)
+            # ricerche identiche in corso condividono un solo scraping
+            return search_service.coalesce(key, lambda: get_shared_scraper().search_properties(**params))
+
+        # 'search' è il tempo reale di cache e scraping; le fasi dello scraper lo suddividono
+        with profiling.stage('search'):
+            if search_cache is not None:
+                properties, cache_status = search_cache.get_or_compute(key, scrape)
+                metrics.CACHE_REQUESTS.inc(result=cache_status)
+            else:
+                properties, cache_status = scrape(), 'off'
+
+        with profiling.stage('scoring'):
+            properties = search_service.rank(properties, params, top_k=search_service.result_limit())
+
+        payload = search_service.search_payload(properties, cache_status, _compact_requested())
+        with profiling.stage('serialize'):
+            response = jsonify(payload)
+        response.headers['X-Cache'] = cache_status.upper()
+        if request.method == 'GET':
+            # ETag sui soli risultati (il campo 'cache' cambia tra MISS e HIT), debole: vale per
+            # tutte le codifiche; stessi risultati -> 304 senza corpo
+            response.headers['Cache-Control'] = 'no-cache'
+            response.set_etag(compression.etag(app.json.dumps(payload['properties']).encode()), weak=True)
+            response = response.make_conditional(request)
+        return response
 
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'properties': []
-        }), 500
+        return jsonify(search_service.error_payload(e)), 500
+
+
+@app.route('/api/search/stream', methods=['GET', 'POST'])
+def search_properties_stream():
+    """
+    Variante in streaming di /api/search: un evento 'batch' per ogni fonte appena risponde,
+    poi un evento 'summary' con la classifica finale (stesso formato di /api/search).
+    Formato NDJSON di default, Server-Sent Events con ?format=sse o Accept: text/event-stream.
+    """
+    params = _search_params()
+    invalid = search_service.params_error(params)
+    if invalid:
+        return jsonify(search_service.error_payload(ValueError(invalid))), 400
+    use_sse = (request.args.get('format') == 'sse'
+               or 'text/event-stream' in request.headers.get('Accept', ''))
+
+    def encode(event):
+        return search_service.encode_event(event, use_sse)
+
+    def events():
+        try:
+            key = search_service.search_key(params)
+            cached = search_cache.lookup(key) if search_cache is not None else None
+            if search_cache is not None:
+                metrics.CACHE_REQUESTS.inc(result='hit' if cached is not None else 'miss')
+            if cached is not None:
+                batches, cache_status = [('cache', cached)], 'hit'
+            elif listing_index is not None:
+                batches = [('index', search_service.search_from_index(params))]
+                cache_status = 'miss' if search_cache is not None else 'off'
+            else:
+                # ricerche identiche in corso (anche da /api/search) condividono un solo scraping
+                scraper = get_shared_scraper()
+                batches = search_service.coalesce_stream(
+                    key, lambda: scraper.iter_sources(dict(params, home_apartment=None)), scraper._aggregate)
+                cache_status = 'miss' if search_cache is not None else 'off'
+
+            # cache e indice danno un solo batch con il risultato completo (anche migliaia di
+            # annunci): basta la classifica limitata, che è già quella del summary
+            single = cached is not None or listing_index is not None
+            top_k = search_service.result_limit() if single else None
+            for source_name, properties in batches:
+                aggregated = properties
+                # la ricerca live chiude con (None, risultato aggregato)
+                if source_name is not None:
+                    ranked = search_service.rank(properties, params, top_k=top_k)
+                    yield encode({'type': 'batch', 'source': source_name,
+                                  'count': len(properties), 'properties': ranked})
 
+            if not single:
+                ranked = search_service.rank(aggregated, params, top_k=search_service.result_limit())
+            if search_cache is not None and cached is None:
+                search_cache.store(key, aggregated)
+
+            yield encode(dict(search_service.search_payload(ranked, cache_status), type='summary'))
+        except Exception as e:
+            yield encode(dict(search_service.error_payload(e), type='error'))
+
+    mimetype = 'text/event-stream' if use_sse else 'application/x-ndjson'
+    response = Response(stream_with_context(events()), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # niente buffering nei reverse proxy
+    return response
+
+
+@app.route('/api/saved-searches', methods=['GET', 'POST'])
+def saved_searches_endpoint():
+    """POST salva i filtri (stesso body di /api/search, più 'name'); GET elenca le ricerche salvate"""
+    if request.method == 'POST':
+        payload, status = search_service.create_saved_search(request.get_json(silent=True))
+    else:
+        payload, status = search_service.list_saved_searches()
+    return jsonify(payload), status
+
+
+@app.route('/api/saved-searches/<int:search_id>', methods=['DELETE'])
+def delete_saved_search(search_id):
+    payload, status = search_service.delete_saved_search(search_id)
+    return jsonify(payload), status
+
+
+@app.route('/api/saved-searches/<int:search_id>/new', methods=['GET'])
+def saved_search_new(search_id):
+    """Annunci nuovi o cambiati dall'ultimo controllo che corrispondono alla ricerca salvata"""
+    try:
+        payload, status = search_service.saved_search_new(search_id, request.args.get('since'))
+        return jsonify(payload), status
+    except Exception as e:
+        return jsonify(search_service.error_payload(e)), 500
 
 
 if __name__ == "__main__":
@@ -89,8 +276,11 @@ if __name__ == "__main__":
 ║ Server avviato su porta {port}                            ║
 ║ Endpoints:                                                ║
 ║  - GET  /api/health                                      ║
+║  - GET  /api/metrics                                     ║
 ║  - GET  /api/search                                      ║
 ║  - POST /api/search                                      ║
+║  - POST /api/search/stream                               ║
+║  - GET  /api/saved-searches/<id>/new                     ║
 ╚═══════════════════════════════════════════════════════════╝
 """)
 
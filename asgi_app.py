@@ -0,0 +1,258 @@
+"""
+IVG Real Estate API Server - modalità asincrona
+Server ASGI (Starlette) con le stesse rotte e lo stesso contratto JSON di app.py:
+le ricerche live usano AsyncIVGScraper, quindi un worker uvicorn tiene aperte molte
+ricerche in attesa dei portali senza un thread per ciascuna.
+
+Avvio:
+  uvicorn asgi_app:app --host 0.0.0.0 --port 5000 --workers 2
+  gunicorn asgi_app:app -k uvicorn.workers.UvicornWorker --workers 2 --timeout 60
+"""
+
+import asyncio
+import contextlib
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+import search_service
+from async_scraper import get_shared_async_scraper
+from search_service import listing_index, search_cache
+
+search_service.start_background_crawler()
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+    'Access-Control-Allow-Methods': 'GET,POST,DELETE,OPTIONS',
+}
+
+# riferimenti ai ricalcoli stale-while-revalidate in corso (il loop tiene solo riferimenti deboli)
+_refresh_tasks = set()
+
+
+async def observe_requests(request: Request, call_next):
+    """Metriche HTTP e intestazioni CORS, come after_request in app.py"""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get('route')
+    endpoint = getattr(route, 'path', 'unknown')
+    metrics.HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+    response.headers.update(CORS_HEADERS)
+    return response
+
+
+async def _search_params(request: Request):
+    """Filtri di ricerca dal body JSON (POST) o dalla query string (GET)"""
+    if request.method == 'POST':
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        return search_service.params_from_json(data)
+    return search_service.params_from_query(request.query_params)
+
+
+async def _compact_requested(request: Request) -> bool:
+    """Come app.py: ?compact=1 oppure "compact": true nel body JSON"""
+    if search_service.wants_compact(request.query_params.get('compact')):
+        return True
+    if request.method != 'POST':
+        return False
+    try:
+        data = await request.json()
+    except ValueError:
+        return False
+    return isinstance(data, dict) and search_service.wants_compact(data.get('compact'))
+
+
+async def _scrape(key, params):
+    if listing_index is not None:
+        return await asyncio.to_thread(search_service.search_from_index, params)
+    # ricerche identiche in corso condividono un solo scraping
+    return await search_service.coalesce_async(
+        key, lambda: get_shared_async_scraper().search_properties(**params))
+
+
+def _refresh_in_background(key, params) -> None:
+    if not search_cache.claim_refresh(key):
+        return
+
+    async def refresh():
+        try:
+            value = await _scrape(key, params)
+            await asyncio.to_thread(search_cache.store, key, value)
+        except Exception as e:
+            print(f"[cache] Errore aggiornamento in background: {e}")
+        finally:
+            search_cache.release_refresh(key)
+
+    task = asyncio.ensure_future(refresh())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+async def index(request: Request):
+    return FileResponse(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html'))
+
+
+async def health_check(request: Request):
+    return JSONResponse({
+        'status': 'ok',
+        'message': 'IVG API Server is running'
+    })
+
+
+async def metrics_endpoint(request: Request):
+    return Response(metrics.REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+
+async def search_properties(request: Request):
+    try:
+        params = await _search_params(request)
+        invalid = search_service.params_error(params)
+        if invalid:
+            return JSONResponse(search_service.error_payload(ValueError(invalid)), status_code=400)
+        key = search_service.search_key(params)
+
+        if search_cache is not None:
+            # il backend sqlite fa I/O su file: fuori dall'event loop
+            cached = await asyncio.to_thread(search_cache.peek, key)
+            if cached is not None:
+                properties, cache_status = cached
+                if cache_status == search_cache.STALE:
+                    _refresh_in_background(key, params)
+            else:
+                properties, cache_status = await _scrape(key, params), search_cache.MISS
+                await asyncio.to_thread(search_cache.store, key, properties)
+            metrics.CACHE_REQUESTS.inc(result=cache_status)
+        else:
+            properties, cache_status = await _scrape(key, params), 'off'
+
+        properties = search_service.rank(properties, params, top_k=search_service.result_limit())
+
+        return JSONResponse(search_service.search_payload(properties, cache_status,
+                                                          await _compact_requested(request)),
+                            headers={'X-Cache': cache_status.upper()})
+
+    except Exception as e:
+        return JSONResponse(search_service.error_payload(e), status_code=500)
+
+
+async def search_properties_stream(request: Request):
+    """Variante in streaming di /api/search, stesso formato di app.py (NDJSON o SSE)"""
+    params = await _search_params(request)
+    invalid = search_service.params_error(params)
+    if invalid:
+        return JSONResponse(search_service.error_payload(ValueError(invalid)), status_code=400)
+    use_sse = (request.query_params.get('format') == 'sse'
+               or 'text/event-stream' in request.headers.get('accept', ''))
+
+    def encode(event):
+        return search_service.encode_event(event, use_sse)
+
+    async def events():
+        try:
+            key = search_service.search_key(params)
+            cached = await asyncio.to_thread(search_cache.lookup, key) if search_cache is not None else None
+            if search_cache is not None:
+                metrics.CACHE_REQUESTS.inc(result='hit' if cached is not None else 'miss')
+            cache_status = 'hit' if cached is not None else ('miss' if search_cache is not None else 'off')
+
+            scraper = get_shared_async_scraper()
+            if cached is not None or listing_index is not None:
+                name = 'cache' if cached is not None else 'index'
+                properties = cached if cached is not None else await _scrape(key, params)
+                # un solo batch con il risultato completo: basta la classifica limitata del summary
+                ranked = search_service.rank(properties, params, top_k=search_service.result_limit())
+                yield encode({'type': 'batch', 'source': name,
+                              'count': len(properties), 'properties': ranked})
+                aggregated = properties
+            else:
+                # ricerche identiche in corso (anche da /api/search) condividono un solo scraping
+                batches = search_service.coalesce_stream_async(
+                    key, lambda: scraper.iter_sources(dict(params, home_apartment=None)), scraper._aggregate)
+                async for source_name, properties in batches:
+                    aggregated = properties
+                    # la ricerca live chiude con (None, risultato aggregato)
+                    if source_name is not None:
+                        yield encode({'type': 'batch', 'source': source_name,
+                                      'count': len(properties), 'properties': search_service.rank(properties, params)})
+                ranked = search_service.rank(aggregated, params, top_k=search_service.result_limit())
+
+            if search_cache is not None and cached is None:
+                await asyncio.to_thread(search_cache.store, key, aggregated)
+
+            yield encode(dict(search_service.search_payload(ranked, cache_status), type='summary'))
+        except Exception as e:
+            yield encode(dict(search_service.error_payload(e), type='error'))
+
+    media_type = 'text/event-stream' if use_sse else 'application/x-ndjson'
+    return StreamingResponse(events(), media_type=media_type,
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def saved_searches_endpoint(request: Request):
+    """Come app.py: POST salva i filtri, GET elenca le ricerche salvate"""
+    if request.method == 'POST':
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        payload, status = await asyncio.to_thread(search_service.create_saved_search, data)
+    else:
+        payload, status = await asyncio.to_thread(search_service.list_saved_searches)
+    return JSONResponse(payload, status_code=status)
+
+
+async def delete_saved_search(request: Request):
+    payload, status = await asyncio.to_thread(search_service.delete_saved_search,
+                                              request.path_params['search_id'])
+    return JSONResponse(payload, status_code=status)
+
+
+async def saved_search_new(request: Request):
+    try:
+        payload, status = await asyncio.to_thread(search_service.saved_search_new,
+                                                  request.path_params['search_id'],
+                                                  request.query_params.get('since'))
+        return JSONResponse(payload, status_code=status)
+    except Exception as e:
+        return JSONResponse(search_service.error_payload(e), status_code=500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    # chiude il pool di connessioni httpx del worker
+    await get_shared_async_scraper().aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/api/health', health_check, methods=['GET']),
+        Route('/api/metrics', metrics_endpoint, methods=['GET']),
+        Route('/api/search', search_properties, methods=['GET', 'POST']),
+        Route('/api/search/stream', search_properties_stream, methods=['GET', 'POST']),
+        Route('/api/saved-searches', saved_searches_endpoint, methods=['GET', 'POST']),
+        Route('/api/saved-searches/{search_id:int}', delete_saved_search, methods=['DELETE']),
+        Route('/api/saved-searches/{search_id:int}/new', saved_search_new, methods=['GET']),
+    ],
+    middleware=[Middleware(BaseHTTPMiddleware, dispatch=observe_requests)],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
@@ -0,0 +1,256 @@
+"""
+IVG Real Estate - Scraper asincrono
+Variante di IVGScraper per il server ASGI (asgi_app.py): le richieste verso i portali
+passano da httpx.AsyncClient, così un worker serve molte ricerche in attesa senza
+occupare un thread ciascuna. Analisi HTML, cache delle pagine, circuit breaker,
+timeout adattivi e metriche sono quelli di IVGScraper.
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+import metrics
+from ivg_scraper import IVGScraper
+
+
+class AsyncIVGScraper(IVGScraper):
+    """IVGScraper con I/O non bloccante: stessi parametri, metodi di ricerca `async`"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """
+        Client con un pool di connessioni keep-alive per ogni portale (stessa politica
+        HTTP_DEFAULTS della sessione requests). httpx ripete da sé solo gli errori di
+        connessione: i codici di status_forcelist sono ripetuti in _get_async.
+        """
+        mounts = {}
+        for source in self.SOURCES:
+            config = self._http_config(source)
+            limits = httpx.Limits(max_connections=config['pool_maxsize'],
+                                  max_keepalive_connections=config['pool_connections'])
+            mounts[source['base_url']] = httpx.AsyncHTTPTransport(limits=limits,
+                                                                  retries=config['retries'])
+        return httpx.AsyncClient(headers=dict(self.session.headers), mounts=mounts,
+                                 follow_redirects=True, timeout=self.timeout)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # creato al primo uso, dentro l'event loop del worker
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def search_properties(self,
+                                max_price: Optional[float] = None,
+                                min_size: Optional[float] = None,
+                                location: Optional[str] = None,
+                                home_apartment: Optional[str] = None,
+                                locazione: Optional[str] = None,
+                                stato: Optional[str] = None,
+                                radius_km: Optional[float] = None,
+                                q: Optional[str] = None) -> List[Dict]:
+        filters = dict(max_price=max_price, min_size=min_size, location=location,
+                       home_apartment=home_apartment, locazione=locazione, stato=stato,
+                       radius_km=radius_km, q=q)
+        results: Dict[str, List[Dict]] = {}
+        total = 0
+        async for name, properties in self.iter_sources(filters):
+            results[name] = properties
+            total += len(properties)
+            if not self.concurrent and total >= self.MAX_RESULTS:
+                break
+        return self._aggregate(results)
+
+    async def iter_sources(self, filters: Dict) -> AsyncIterator[Tuple[str, List[Dict]]]:
+        """
+        Come IVGScraper.iter_sources: (nome fonte, immobili) nell'ordine di arrivo.
+        Le fonti oltre la deadline vengono cancellate invece di essere lasciate finire.
+        """
+        if not self.concurrent:
+            for source in self.SOURCES:
+                print(f"[scraper] Tentativo con {source['name']}...")
+                yield source['name'], await self._scrape_source_safe(source, filters)
+            return
+
+        tasks = {}
+        for source in self.SOURCES:
+            print(f"[scraper] Tentativo con {source['name']}...")
+            tasks[asyncio.ensure_future(self._scrape_source_safe(source, filters))] = source
+        pending = set(tasks)
+        expires = time.monotonic() + self.deadline if self.deadline is not None else None
+        try:
+            while pending:
+                remaining = None if expires is None else max(0.0, expires - time.monotonic())
+                done, pending = await asyncio.wait(pending, timeout=remaining,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    for task in pending:
+                        name = tasks[task]['name']
+                        print(f"[scraper] ✗ {name} oltre la deadline di {self.deadline}s, ignorato")
+                        metrics.SOURCE_DEADLINE_EXCEEDED.inc(source=name)
+                    break
+                for task in done:
+                    yield tasks[task]['name'], task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _scrape_source_safe(self, source: Dict, filters: Dict,
+                                  max_pages: Optional[int] = None) -> List[Dict]:
+        if not self._allow_source(source):
+            return []
+        try:
+            properties = await self._scrape_source(source, max_pages=max_pages, **filters)
+        except Exception as e:
+            print(f"[scraper] Errore con {source['name']}: {e}")
+            return []
+        finally:
+            # prova half-open senza esito: errore fuori dalla richiesta o task annullato alla deadline
+            self._source_health(source).release_probe()
+        self._log_outcome(source, properties)
+        return properties
+
+    async def _scrape_source(self, source: Dict, max_price: Optional[float],
+                             min_size: Optional[float], location: Optional[str],
+                             home_apartment: Optional[str], locazione: Optional[str],
+                             stato: Optional[str], max_pages: Optional[int] = None,
+                             radius_km: Optional[float] = None, q: Optional[str] = None) -> List[Dict]:
+        properties: List[Dict] = []
+        try:
+            params = self._query_params(max_price, min_size, location, home_apartment, locazione, stato,
+                                        radius_km, source.get('params'))
+            pages = await self._crawl_pages(source, params,
+                                            max_pages or source.get('max_pages') or self.max_pages)
+            properties = self._collect(source, pages, max_price, min_size, location, radius_km, q)
+        except Exception as e:
+            print(f"[scraper] Errore scraping {source['name']}: {e}")
+        return properties
+
+    async def _crawl_pages(self, source: Dict, params: Dict, max_pages: int) -> List[Dict]:
+        """Come IVGScraper._crawl_pages, con al più `page_workers` pagine in volo per livello"""
+        first = await self._fetch_page(source, source['search_url'], params or None)
+        pages = [first]
+        seen = {first['url']}
+        frontier = first['links']
+        semaphore = asyncio.Semaphore(self.page_workers)
+
+        async def fetch(url):
+            async with semaphore:
+                return await self._fetch_page(source, url)
+
+        while frontier and len(pages) < max_pages:
+            batch = []
+            for url in frontier:
+                if url not in seen and len(pages) + len(batch) < max_pages:
+                    seen.add(url)
+                    batch.append(url)
+            if not batch:
+                break
+            frontier = []
+            for page in await asyncio.gather(*(fetch(url) for url in batch), return_exceptions=True):
+                if isinstance(page, Exception):
+                    print(f"[scraper] Errore pagina successiva {source['name']}: {page}")
+                    continue
+                pages.append(page)
+                frontier.extend(page['links'])
+        return pages
+
+    async def _fetch_page(self, source: Dict, url: str, params: Optional[Dict] = None) -> Dict:
+        """Come IVGScraper._fetch_page; l'analisi HTML gira in un thread per non bloccare il loop"""
+        page_key, cached, headers = self._conditional_request(url, params)
+        timeout = self._source_timeout(source)
+        metrics.SOURCE_TIMEOUT_SECONDS.set(timeout, source=source['name'])
+        delay = self._reserve_host_slot(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        started = time.perf_counter()
+        try:
+            response = await self._hedged_get(source, url, params, headers, timeout)
+        except httpx.TimeoutException:
+            self._record_error(source, 'timeout')
+            raise
+        except httpx.TransportError:
+            self._record_error(source, 'connection_error')
+            raise
+        except asyncio.CancelledError:
+            # deadline della ricerca: non è un errore del portale, ma la prova half-open va chiusa
+            metrics.SOURCE_RESPONSES.inc(source=source['name'], status='cancelled')
+            self._source_health(source).release_probe()
+            raise
+        except Exception:
+            # httpx.DecodingError, TooManyRedirects...
+            self._record_error(source, 'error')
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            metrics.SOURCE_REQUEST_SECONDS.observe(latency, source=source['name'])
+        self._record_status(source, response.status_code, latency)
+        if response.status_code == 304 and cached:
+            return self._remember_page(page_key, cached)
+        response.raise_for_status()
+        return await asyncio.to_thread(self._page_from_response, source, page_key, cached,
+                                       response.content, response.url, response.headers)
+
+    async def _get_async(self, source: Dict, url: str, params: Optional[Dict], headers: Dict,
+                         timeout: float) -> httpx.Response:
+        config = self._http_config(source)
+        for attempt in range(config['retries'] + 1):
+            response = await self.client.get(url, params=params, headers=headers or None, timeout=timeout)
+            if response.status_code not in config['status_forcelist'] or attempt == config['retries']:
+                return response
+            await asyncio.sleep(config['backoff_factor'] * (2 ** attempt))
+        return response
+
+    async def _hedged_get(self, source: Dict, url: str, params: Optional[Dict], headers: Dict,
+                          timeout: float) -> httpx.Response:
+        """Come IVGScraper._hedged_get: richiesta di riserva dopo il p90, vince la prima risposta"""
+        delay = self._source_health(source).hedge_delay() if self.hedging else None
+        if delay is None or delay >= timeout:
+            return await self._get_async(source, url, params, headers, timeout)
+
+        first = asyncio.ensure_future(self._get_async(source, url, params, headers, timeout))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        metrics.HEDGED_REQUESTS.inc(source=source['name'], outcome='sent')
+        second = asyncio.ensure_future(self._get_async(source, url, params, headers, timeout))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is second:
+                        metrics.HEDGED_REQUESTS.inc(source=source['name'], outcome='won')
+                    return task.result()
+        finally:
+            # la richiesta perdente non serve più
+            for task in pending:
+                task.cancel()
+        raise error
+
+
+_shared_async_scraper: Optional[AsyncIVGScraper] = None
+
+
+def get_shared_async_scraper() -> AsyncIVGScraper:
+    """Scraper asincrono unico per worker: riusa il pool di connessioni httpx tra le richieste"""
+    global _shared_async_scraper
+    if _shared_async_scraper is None:
+        _shared_async_scraper = AsyncIVGScraper()
+    return _shared_async_scraper
@@ -0,0 +1,230 @@
+"""
+IVG Real Estate - Punteggio e ordinamento in blocco
+Versione vettoriale di calculate_match_score (stessi pesi 40/25/20/4/4, più i punti della
+ricerca testuale) su colonne NumPy, con selezione top-k tramite ordinamento parziale.
+Accetta liste di annunci oppure ListingColumns, le cui colonne vengono lette senza copie.
+"""
+
+import heapq
+from typing import Dict, List, Optional, Sequence, Union
+
+from fulltext import TEXT_POINTS, analyze, document_terms, query_terms, relevance
+from ivg_scraper import calculate_match_score, location_score, locazione_points, stato_points
+from listing import ListingColumns
+
+try:
+    import numpy as np
+except ImportError:  # senza NumPy si ricade sul calcolo annuncio per annuncio
+    np = None
+
+
+def _text_points(values: Sequence, func) -> List[int]:
+    """Applica func una volta per valore distinto: le colonne testuali sono molto ripetitive"""
+    memo: Dict = {}
+    points = []
+    for value in values:
+        if value not in memo:
+            memo[value] = func(value)
+        points.append(memo[value])
+    return points
+
+
+def _numeric_points(price, size, max_price: Optional[float], min_size: Optional[float]):
+    score = np.zeros(len(price), dtype=np.int64)
+
+    # prezzo: meglio se sotto il limite
+    if max_price and max_price > 0:
+        ratio = np.maximum(0.0, (max_price - price) / max_price)
+        score += np.where(price > 0, np.floor(np.minimum(40, ratio * 40)), 0).astype(np.int64)
+
+    # dimensione: meglio se >= richiesta
+    if min_size and min_size > 0:
+        ratio = np.maximum(0.0, (size - min_size) / np.maximum(size, 1))
+        score += np.where(size > 0, np.floor(np.minimum(25, ratio * 25)), 0).astype(np.int64)
+
+    return score
+
+
+def _relevance_points(text_relevance: Sequence[float]):
+    return np.floor(np.minimum(TEXT_POINTS, np.asarray(text_relevance, dtype=np.float64)
+                               * TEXT_POINTS)).astype(np.int64)
+
+
+def column_documents(columns: ListingColumns) -> List[List[str]]:
+    """Termini di ricerca di ogni annuncio, dalle colonne testuali e categoriali"""
+    type_codes, vocab = columns.codes('type')
+    condition_codes, _ = columns.codes('condition')
+    # tipologia e stato: un'analisi per valore del vocabolario
+    coded = [analyze(value) if isinstance(value, str) else () for value in vocab]
+    return [list(analyze(title)) + list(analyze(description)) + list(coded[t]) + list(coded[c])
+            for title, description, t, c in zip(columns.text('title'), columns.text('description'),
+                                                type_codes, condition_codes)]
+
+
+def text_relevance(properties: Union[List[Dict], ListingColumns], q: Optional[str]) -> Optional[List[float]]:
+    """Pertinenza BM25 normalizzata di ogni annuncio alla query q (None senza query)"""
+    terms = query_terms(q)
+    if not terms:
+        return None
+    if isinstance(properties, ListingColumns):
+        documents = column_documents(properties)
+    else:
+        documents = (document_terms(p) for p in properties)
+    return relevance(documents, terms)
+
+
+def score_columns(price: Sequence[float], size: Sequence[float], location: Sequence[str],
+                  prop_type: Sequence[str], condition: Sequence[str],
+                  max_price: Optional[float], min_size: Optional[float], loc: Optional[str],
+                  locazione: Optional[str] = None, stato: Optional[str] = None,
+                  radius_km: Optional[float] = None, text_relevance: Optional[Sequence[float]] = None):
+    """Punteggi per un insieme di annunci in forma colonnare (array NumPy di interi)"""
+    price = np.asarray(price, dtype=np.float64)
+    size = np.asarray(size, dtype=np.float64)
+    score = _numeric_points(price, size, max_price, min_size)
+
+    if loc:
+        score += np.asarray(_text_points(location, lambda v: location_score(v, loc, radius_km) if v else 0),
+                            dtype=np.int64)
+    if locazione:
+        pairs = list(zip(prop_type, condition))
+        score += np.asarray(_text_points(pairs, lambda v: locazione_points(v[0], v[1] or '', locazione)
+                                         if v[0] else 0), dtype=np.int64)
+    if stato:
+        score += np.asarray(_text_points(condition, lambda v: stato_points(v, stato) if v else 0),
+                            dtype=np.int64)
+    if text_relevance is not None:
+        score += _relevance_points(text_relevance)
+
+    return np.minimum(100, score)
+
+
+def _coded_points(codes, vocab: List, func):
+    """Applica func una volta per codice presente e distribuisce i punti per indice"""
+    codes = np.frombuffer(codes, dtype=codes.typecode)
+    table = np.zeros(len(vocab), dtype=np.int64)
+    for code in np.unique(codes).tolist():
+        table[code] = func(vocab[code])
+    return table[codes]
+
+
+def score_listing_columns(columns: ListingColumns, max_price: Optional[float],
+                          min_size: Optional[float], loc: Optional[str],
+                          locazione: Optional[str] = None, stato: Optional[str] = None,
+                          radius_km: Optional[float] = None,
+                          text_relevance: Optional[Sequence[float]] = None):
+    """Come score_columns, direttamente sulle colonne di un ListingColumns"""
+    if not len(columns):
+        return np.zeros(0, dtype=np.int64)
+    # viste sugli array('d') del contenitore, senza copia
+    price = np.frombuffer(columns.floats('price'), dtype=np.float64)
+    size = np.frombuffer(columns.floats('size'), dtype=np.float64)
+    score = _numeric_points(price, size, max_price, min_size)
+
+    if loc:
+        codes, vocab = columns.codes('location')
+        score += _coded_points(codes, vocab, lambda v: location_score(v, loc, radius_km) if v else 0)
+    if locazione:
+        type_codes, vocab = columns.codes('type')
+        condition_codes, _ = columns.codes('condition')
+        n = len(vocab)
+        # coppie (tipo, stato) come un solo codice: punti calcolati una volta per coppia
+        pairs = (np.frombuffer(type_codes, dtype=type_codes.typecode).astype(np.int64) * n
+                 + np.frombuffer(condition_codes, dtype=condition_codes.typecode))
+        unique, inverse = np.unique(pairs, return_inverse=True)
+
+        def pair_points(pair):
+            prop_type, condition = vocab[pair // n], vocab[pair % n]
+            return locazione_points(prop_type, condition or '', locazione) if prop_type else 0
+
+        points = np.asarray([pair_points(pair) for pair in unique.tolist()], dtype=np.int64)
+        score += points[inverse.reshape(-1)]
+    if stato:
+        codes, vocab = columns.codes('condition')
+        score += _coded_points(codes, vocab, lambda v: stato_points(v, stato) if v else 0)
+    if text_relevance is not None:
+        score += _relevance_points(text_relevance)
+
+    return np.minimum(100, score)
+
+
+def score_properties(properties: List[Dict], max_price: Optional[float], min_size: Optional[float],
+                     location: Optional[str], home_apartment: Optional[str] = None,
+                     locazione: Optional[str] = None, stato: Optional[str] = None,
+                     radius_km: Optional[float] = None,
+                     text_relevance: Optional[Sequence[float]] = None) -> List[int]:
+    """Stesso risultato di calculate_match_score applicato a ogni annuncio"""
+    if np is None:
+        relevances = text_relevance if text_relevance is not None else [0.0] * len(properties)
+        return [calculate_match_score(p, max_price, min_size, location, locazione=locazione, stato=stato,
+                                      radius_km=radius_km, text_relevance=r)
+                for p, r in zip(properties, relevances)]
+    if not properties:
+        return []
+    scores = score_columns(
+        [p.get('price') or 0 for p in properties],
+        [p.get('size') or 0 for p in properties],
+        [p.get('location') or '' for p in properties],
+        [p.get('type') or '' for p in properties],
+        [p.get('condition') or '' for p in properties],
+        max_price, min_size, location, locazione=locazione, stato=stato, radius_km=radius_km,
+        text_relevance=text_relevance,
+    )
+    return scores.tolist()
+
+
+def top_k_indices(scores: Sequence[int], top_k: Optional[int] = None) -> List[int]:
+    """
+    Indici dei migliori top_k punteggi in ordine decrescente; a parità di punteggio vale
+    l'ordine originale, come con list.sort(reverse=True) che è stabile.
+    Con NumPy si ordina solo la pagina restituita (argpartition + sort dei k selezionati).
+    """
+    n = len(scores)
+    if top_k is None or top_k >= n:
+        top_k = n
+    if top_k <= 0:
+        return []
+    if np is None:
+        return heapq.nsmallest(top_k, range(n), key=lambda i: (-scores[i], i))
+    # chiave unica: punteggio decrescente, poi indice crescente
+    keys = -np.asarray(scores, dtype=np.int64) * n + np.arange(n, dtype=np.int64)
+    if top_k < n:
+        selected = np.argpartition(keys, top_k - 1)[:top_k]
+    else:
+        selected = np.arange(n)
+    return selected[np.argsort(keys[selected])].tolist()
+
+
+def rank_properties(properties: Union[List[Dict], ListingColumns], max_price: Optional[float],
+                    min_size: Optional[float], location: Optional[str], locazione: Optional[str] = None,
+                    stato: Optional[str] = None, top_k: Optional[int] = None,
+                    radius_km: Optional[float] = None, q: Optional[str] = None) -> List[Dict]:
+    """
+    Restituisce i migliori top_k annunci ordinati, come copie con matchScore:
+    gli originali (ad esempio quelli in cache) non vengono modificati.
+    Con q la pertinenza BM25 alla query si aggiunge al punteggio.
+    """
+    relevances = text_relevance(properties, q)
+    if isinstance(properties, ListingColumns):
+        if np is None:
+            properties = properties.to_dicts()
+        else:
+            scores = score_listing_columns(properties, max_price, min_size, location,
+                                           locazione=locazione, stato=stato, radius_km=radius_km,
+                                           text_relevance=relevances)
+            indices = top_k_indices(scores, top_k)
+            # dizionari creati solo per gli annunci restituiti
+            ranked = properties.to_dicts(indices)
+            for prop, i in zip(ranked, indices):
+                prop['matchScore'] = int(scores[i])
+            return ranked
+
+    scores = score_properties(properties, max_price, min_size, location,
+                              locazione=locazione, stato=stato, radius_km=radius_km,
+                              text_relevance=relevances)
+    ranked = []
+    for i in top_k_indices(scores, top_k):
+        prop = dict(properties[i])
+        prop['matchScore'] = int(scores[i])
+        ranked.append(prop)
+    return ranked
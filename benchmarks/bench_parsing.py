@@ -0,0 +1,68 @@
+"""
+IVG Real Estate - Benchmark del parsing
+Confronta i motori di parsing sulle pagine registrate in benchmarks/fixtures:
+html.parser sull'intero documento (percorso storico) contro lxml e parsing mirato.
+
+Uso:
+    python benchmarks/bench_parsing.py [--iterations 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ivg_scraper import IVGScraper, resolve_parser  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixtures():
+    pages = {}
+    for source in IVGScraper.SOURCES:
+        path = os.path.join(FIXTURES_DIR, f"{source['name']}.html")
+        with open(path, 'rb') as f:
+            pages[source['name']] = (f.read(), source['base_url'])
+    return pages
+
+
+def configurations():
+    configs = [('html.parser', False), ('html.parser', True)]
+    if resolve_parser('auto') == 'lxml':
+        configs += [('lxml', False), ('lxml', True)]
+    return configs
+
+
+def run(iterations: int) -> None:
+    pages = load_fixtures()
+    baseline_results = None
+    baseline_rate = None
+    print(f"{'motore':<14}{'mirato':<8}{'pagine/s':>10}{'card/s':>12}{'speedup':>10}")
+    for parser, targeted in configurations():
+        scraper = IVGScraper(parser=parser, targeted_parsing=targeted)
+        results = {}
+        cards = 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for name, (content, base_url) in pages.items():
+                soup = scraper._make_soup(content)
+                results[name] = scraper._parse_page(soup, base_url)
+                cards += len(results[name])
+        elapsed = time.perf_counter() - started
+        rate = cards / elapsed
+        if baseline_results is None:
+            baseline_results, baseline_rate = results, rate
+        elif results != baseline_results:
+            # il parsing mirato deve estrarre esattamente gli stessi annunci
+            print(f"[bench] ATTENZIONE: risultati diversi con {parser} mirato={targeted}")
+        pages_rate = iterations * len(pages) / elapsed
+        print(f"{parser:<14}{'sì' if targeted else 'no':<8}{pages_rate:>10.1f}{rate:>12.0f}"
+              f"{rate / baseline_rate:>9.2f}x")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Benchmark del parsing delle pagine dei portali')
+    arg_parser.add_argument('--iterations', type=int, default=20)
+    run(arg_parser.parse_args().iterations)
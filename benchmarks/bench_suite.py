@@ -0,0 +1,272 @@
+"""
+IVG Real Estate - Suite di benchmark offline
+Riproduce le risposte registrate in benchmarks/fixtures tramite un server HTTP locale
+che sostituisce i portali, e misura le fasi principali dello scraper e di /api/search:
+throughput, latenza p50/p99 e picco di memoria.
+
+Uso:
+    python benchmarks/bench_suite.py                          # esegue e stampa il report
+    python benchmarks/bench_suite.py --save baseline.json     # salva i risultati come riferimento
+    python benchmarks/bench_suite.py --compare baseline.json  # esce con codice 1 se c'è una regressione
+
+Prima delle misure la suite verifica alcuni risultati del percorso live (filtri combinati):
+se una verifica fallisce esce con codice 1.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+from urllib.parse import urlparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# la suite misura sempre lo scraping live, senza cache né indice
+os.environ['IVG_CACHE_BACKEND'] = 'off'
+os.environ['IVG_SEARCH_BACKEND'] = 'live'
+
+import ivg_scraper  # noqa: E402
+from ivg_scraper import IVGScraper, calculate_match_score  # noqa: E402
+from batch_scoring import rank_properties  # noqa: E402
+from fulltext import matches, query_terms  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+SEARCH_PARAMS = {'max_price': 150000, 'min_size': 70, 'location': 'Reggio Emilia',
+                 'locazione': 'Appartamento', 'stato': 'Abitabile'}
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """
+    Serve la fixture della fonte indicata dal primo segmento del path, per ogni query; i link
+    di paginazione delle fixture (/immobili?page=2...) ricevono la fixture della loro fonte.
+    """
+
+    fixtures: Dict[str, bytes] = {}
+    pagination_paths: Dict[str, str] = {}  # path dei link di paginazione -> fonte
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        name = self.pagination_paths.get(path) or path.strip('/').split('/')[0]
+        body = self.fixtures.get(name)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_replay_server() -> ThreadingHTTPServer:
+    scraper = IVGScraper()
+    for source in IVGScraper.SOURCES:
+        name = source['name']
+        with open(os.path.join(FIXTURES_DIR, f"{name}.html"), 'rb') as f:
+            ReplayHandler.fixtures[name] = f.read()
+        # gli stessi link che lo scraper seguirà, estratti con la sua logica di paginazione
+        soup = scraper._make_soup(ReplayHandler.fixtures[name], name)
+        for link in scraper._pagination_links(soup, f"http://replay/{name}"):
+            ReplayHandler.pagination_paths[urlparse(link).path] = name
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ReplayHandler)
+    threading.Thread(target=server.serve_forever, name='ivg-replay', daemon=True).start()
+    return server
+
+
+def replay_scraper_class(server: ThreadingHTTPServer):
+    """Sottoclasse di IVGScraper le cui SOURCES puntano al server di replay"""
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    class ReplayScraper(IVGScraper):
+        SOURCES = [dict(source, base_url=base, search_url=f"{base}/{source['name']}")
+                   for source in IVGScraper.SOURCES]
+
+    return ReplayScraper
+
+
+def measure(func: Callable[[], int], iterations: int) -> Dict:
+    """Esegue func `iterations` volte; func restituisce il numero di elementi elaborati"""
+    func()  # riscaldamento
+    latencies: List[float] = []
+    items = 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        items += func()
+        latencies.append(time.perf_counter() - started)
+    total = sum(latencies)
+
+    # passata separata per la memoria: tracemalloc rallenta e falserebbe i tempi
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'items_per_s': round(items / total, 1) if total else 0.0,
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def build_benchmarks(scraper: IVGScraper) -> Dict[str, Callable[[], int]]:
+    # ogni pagina con il base_url e le regole di estrazione della propria fonte
+    base_urls = {source['name']: source['base_url'] for source in scraper.SOURCES}
+    pages = {name: scraper._make_soup(body, name) for name, body in ReplayHandler.fixtures.items()}
+    json_data = {name: scraper._extract_json_data(soup) for name, soup in pages.items()}
+    json_data = {name: data for name, data in json_data.items() if data}
+    parsed = [prop for name, soup in pages.items()
+              for prop in scraper._parse_page(soup, base_urls[name], name)]
+
+    def extract_json():
+        return sum(1 for soup in pages.values() if scraper._extract_json_data(soup) is not None)
+
+    def parse_json():
+        return sum(len(scraper._parse_json_data(data, base_urls[name], None, None, None, None, None, None))
+                   for name, data in json_data.items())
+
+    def parse_html():
+        return sum(len(scraper._parse_html_listings(soup, base_urls[name], None, None, None, None, None, None))
+                   for name, soup in pages.items())
+
+    def match_score():
+        for prop in parsed:
+            calculate_match_score(prop, SEARCH_PARAMS['max_price'], SEARCH_PARAMS['min_size'],
+                                  SEARCH_PARAMS['location'], locazione=SEARCH_PARAMS['locazione'],
+                                  stato=SEARCH_PARAMS['stato'])
+        return len(parsed)
+
+    def batch_rank():
+        ranked = rank_properties(parsed, SEARCH_PARAMS['max_price'], SEARCH_PARAMS['min_size'],
+                                 SEARCH_PARAMS['location'], locazione=SEARCH_PARAMS['locazione'],
+                                 stato=SEARCH_PARAMS['stato'], top_k=IVGScraper.MAX_RESULTS)
+        return len(parsed) if ranked else 0
+
+    import app as app_module
+    client = app_module.app.test_client()
+
+    def api_search():
+        # senza la cache delle pagine ogni chiamata riscarica e rianalizza tutto
+        scraper._page_cache.clear()
+        response = client.post('/api/search', json=SEARCH_PARAMS)
+        return response.get_json()['count']
+
+    return {
+        '_extract_json_data': extract_json,
+        '_parse_json_data': parse_json,
+        '_parse_html_listings': parse_html,
+        'calculate_match_score': match_score,
+        'rank_properties': batch_rank,
+        '/api/search': api_search,
+    }
+
+
+def verify(scraper: IVGScraper) -> List[str]:
+    """Verifiche di correttezza di /api/search sulle fixture; restituisce gli errori trovati"""
+    import app as app_module
+    client = app_module.app.test_client()
+    errors = []
+
+    def search(**params) -> List[Dict]:
+        scraper._page_cache.clear()
+        return client.get('/api/search', query_string=params).get_json()['properties']
+
+    # ricerca per raggio con parole: gli annunci geolocalizzati devono rispettare anche q
+    nearby = search(location='Modena', radius_km=30)
+    if not nearby:
+        errors.append("raggio: nessun annuncio entro 30 km da Modena, verifica senza effetto")
+    # una parola dei titoli presente solo in una parte degli annunci vicini: se q venisse
+    # ignorato tornerebbero anche gli altri, se filtrasse troppo ne mancherebbero
+    words = sorted({word for prop in nearby for word in prop['title'].split()
+                    if word.isalpha() and query_terms(word)})
+    expected = {word: sum(1 for prop in nearby if matches(prop, query_terms(word))) for word in words}
+    q = next((word for word in words if 0 < expected[word] < len(nearby)), None)
+    if nearby and q is None:
+        errors.append("raggio + q: nessuna parola distingue gli annunci vicini, verifica senza effetto")
+    if q is not None:
+        found = search(location='Modena', radius_km=30, q=q)
+        wrong = [prop['title'] for prop in found if not matches(prop, query_terms(q))]
+        if wrong:
+            errors.append(f"raggio + q={q!r}: {len(wrong)} annunci senza le parole cercate")
+        if len(found) - len(wrong) < expected[q]:
+            errors.append(f"raggio + q={q!r}: {len(found) - len(wrong)} annunci, attesi {expected[q]}")
+    return errors
+
+
+def run(iterations: int) -> Dict[str, Dict]:
+    server = start_replay_server()
+    try:
+        scraper_class = replay_scraper_class(server)
+        # niente ritardi di cortesia verso il server locale; /api/search usa lo scraper di replay
+        scraper = scraper_class(polite_delay=0)
+        ivg_scraper._shared_scraper = scraper
+        errors = verify(scraper)
+        if errors:
+            print("VERIFICHE FALLITE:")
+            for line in errors:
+                print(f"  - {line}")
+            sys.exit(1)
+        results = {}
+        for name, func in build_benchmarks(scraper).items():
+            n = iterations if name != '/api/search' else max(1, iterations // 5)
+            results[name] = measure(func, n)
+        return results
+    finally:
+        server.shutdown()
+
+
+def print_report(results: Dict[str, Dict]) -> None:
+    print(f"{'benchmark':<24}{'elem/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'picco KB':>11}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['items_per_s']:>12.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['peak_kb']:>11.1f}")
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Regressione = p50 o picco di memoria peggiori del riferimento oltre la tolleranza"""
+    regressions = []
+    for name, ref in baseline.items():
+        current = results.get(name)
+        if not current:
+            continue
+        for metric in ('p50_ms', 'peak_kb'):
+            if ref[metric] and current[metric] > ref[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {ref[metric]} -> {current[metric]}")
+    return regressions
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Benchmark offline di IVGScraper e /api/search')
+    arg_parser.add_argument('--iterations', type=int, default=50)
+    arg_parser.add_argument('--save', metavar='FILE', help='salva i risultati in JSON come riferimento')
+    arg_parser.add_argument('--compare', metavar='FILE', help='confronta con un riferimento salvato')
+    arg_parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='peggioramento ammesso rispetto al riferimento (default 0.25 = 25%%)')
+    args = arg_parser.parse_args()
+
+    results = run(args.iterations)
+    print_report(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nRiferimento salvato in {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONI:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\nNessuna regressione rispetto al riferimento")
@@ -0,0 +1,185 @@
+"""
+IVG Real Estate - Coalescenza delle ricerche (single-flight)
+Ricerche identiche che arrivano mentre una è già in corso aspettano quella e ne
+condividono il risultato, invece di ripetere lo scraping di tutte le fonti.
+Dentro un worker si usa un registro in memoria; tra worker diversi un file di lock
+per chiave, insieme alla cache SQLite condivisa.
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: niente lock tra processi, resta la coalescenza nel worker
+    fcntl = None
+
+
+class _Call:
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Una sola esecuzione per chiave alla volta; le richieste concorrenti ne attendono il risultato"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """(risultato, condiviso): condiviso è True se il risultato viene da un'altra richiesta"""
+        call, leader = self.begin(key)
+        if not leader:
+            return self.wait(call), True
+        try:
+            value = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, value)
+        return value, False
+
+    def begin(self, key: str) -> Tuple[_Call, bool]:
+        """
+        (chiamata, leader): il leader calcola il risultato e lo pubblica con finish(),
+        gli altri lo attendono con wait(). Per chi non può racchiudere il calcolo in una
+        funzione, come una risposta in streaming.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    @staticmethod
+    def wait(call: _Call) -> Any:
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.value
+
+    def finish(self, key: str, call: _Call, value: Any = None,
+               error: Optional[BaseException] = None) -> None:
+        call.value = value
+        call.error = error
+        with self._lock:
+            del self._calls[key]
+        call.event.set()
+
+
+class AsyncSingleFlight:
+    """Come SingleFlight, per coroutine nello stesso event loop"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        task, shared = self.start(key, fn)
+        return await asyncio.shield(task), shared
+
+    def start(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[asyncio.Task, bool]:
+        """(task, condiviso) senza attenderlo: il task in corso per la chiave o uno nuovo con fn"""
+        task = self._calls.get(key)
+        shared = task is not None
+        if not shared:
+            # task separato: se il client che l'ha avviato si disconnette, la ricerca condivisa continua
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return task, shared
+
+
+class SharedKeyLock:
+    """
+    Lock per chiave tra processi, con un file per chiave in `directory` (flock).
+    Chi lo ottiene dopo un'attesa trova di norma il risultato già nella cache condivisa.
+    Il file viene rimosso al rilascio, così la cartella non cresce con le chiavi.
+    """
+
+    def __init__(self, directory: str, wait: float = 30.0, poll_interval: float = 0.05):
+        self.directory = directory
+        self.wait = wait
+        self.poll_interval = poll_interval
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.lock')
+
+    def acquire(self, key: str) -> Tuple[Optional[Any], bool]:
+        """
+        (handle, atteso): handle va passato a release(); None se il lock non è arrivato
+        entro `wait` secondi (si procede comunque, senza coordinamento).
+        """
+        path = self._path(key)
+        handle = open(path, 'a+')
+        expires = time.monotonic() + self.wait
+        waited = False
+        while True:
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if time.monotonic() >= expires:
+                    handle.close()
+                    return None, waited
+                waited = True
+                time.sleep(self.poll_interval)
+                continue
+            if self._is_current(handle, path):
+                return handle, waited
+            # chi aveva il lock ha rimosso il file: il lock valido è su quello nuovo
+            handle.close()
+            handle = open(path, 'a+')
+            waited = True
+
+    @staticmethod
+    def _is_current(handle, path: str) -> bool:
+        try:
+            return os.fstat(handle.fileno()).st_ino == os.stat(path).st_ino
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def release(handle) -> None:
+        if handle is not None:
+            # rimosso prima di sbloccarlo: chi è in attesa sul vecchio file se ne accorge e riapre
+            try:
+                os.unlink(handle.name)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            handle.close()
+
+
+def shared_lock_from_env(shared_cache: bool) -> Optional[SharedKeyLock]:
+    """
+    Configurazione da variabili d'ambiente:
+      IVG_COALESCE           process (default) | shared | off
+      IVG_COALESCE_LOCK_DIR  cartella dei file di lock (default: temporanea di sistema)
+      IVG_COALESCE_WAIT      secondi massimi di attesa del lock tra worker (default 30)
+    La modalità shared richiede una cache condivisa tra i worker (IVG_CACHE_BACKEND=sqlite).
+    """
+    if coalescing_mode() != 'shared':
+        return None
+    if fcntl is None:
+        print("[coalesce] Lock tra processi non disponibile su questa piattaforma")
+        return None
+    if not shared_cache:
+        print("[coalesce] IVG_COALESCE=shared richiede IVG_CACHE_BACKEND=sqlite: uso solo il worker")
+        return None
+    directory = os.environ.get('IVG_COALESCE_LOCK_DIR',
+                               os.path.join(tempfile.gettempdir(), 'ivg-search-locks'))
+    return SharedKeyLock(directory, wait=float(os.environ.get('IVG_COALESCE_WAIT', 30)))
+
+
+def coalescing_mode() -> str:
+    return os.environ.get('IVG_COALESCE', 'process').lower()
@@ -0,0 +1,99 @@
+"""
+IVG Real Estate - Compressione e risposte condizionali
+Negoziazione gzip/brotli (brotli solo se il modulo è installato), ETag e file statici
+serviti dalla memoria con le varianti già compresse. Usato da app.py.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # senza brotli si comprime solo con gzip
+    brotli = None
+
+# sotto questa soglia la compressione non ripaga header e CPU
+MIN_SIZE = 1024
+COMPRESSIBLE_MIMETYPES = frozenset(('application/json', 'text/html', 'text/plain', 'text/css',
+                                    'application/javascript'))
+
+# risposte dinamiche: livelli veloci; file statici: compressi una volta sola al massimo livello
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    """Codifiche in ordine di preferenza"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Codifica da usare per l'header Accept-Encoding del client (None = nessuna compressione)"""
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for encoding in supported_encodings():
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0: stesso input, stessi byte (le varianti statiche restano confrontabili)
+        return gzip.compress(data, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+    raise ValueError(f'Codifica non supportata: {encoding}')
+
+
+def etag(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+class StaticFile:
+    """
+    File servito dalla memoria: contenuto, ETag e varianti compresse calcolati una volta,
+    ricaricati solo se il file cambia su disco (data di modifica o dimensione).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat: Optional[Tuple[float, int]] = None
+        self._etag = ''
+        self._variants: Dict[Optional[str], bytes] = {}
+
+    def _load(self) -> None:
+        stat = os.stat(self.path)
+        key = (stat.st_mtime, stat.st_size)
+        if key == self._stat:
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        variants: Dict[Optional[str], bytes] = {None: data}
+        for encoding in supported_encodings():
+            variants[encoding] = compress(data, encoding, best=True)
+        self._etag, self._variants, self._stat = etag(data), variants, key
+
+    def get(self, encoding: Optional[str]) -> Tuple[bytes, str]:
+        """(corpo nella codifica richiesta, ETag del contenuto non compresso)"""
+        with self._lock:
+            self._load()
+            return self._variants.get(encoding, self._variants[None]), self._etag
@@ -0,0 +1,231 @@
+"""
+IVG Real Estate - Deduplicazione tra fonti
+Lo stesso lotto compare spesso su più portali: dopo l'aggregazione gli annunci con
+lo stesso URL canonico, oppure con prezzo, superficie, località e data d'asta
+compatibili, vengono fusi in un solo record tenendo i campi più ricchi. Il confronto
+per somiglianza vale solo tra portali diversi: due lotti della stessa fonte (o dello
+stesso host) con URL diversi restano distinti anche se hanno gli stessi dati.
+Gli annunci sono indicizzati in bucket logaritmici di prezzo e per data d'asta, così ogni
+nuovo annuncio viene confrontato solo con i vicini di prezzo della stessa data (o senza
+data): costo quasi lineare anche sui crawl grandi.
+"""
+
+import math
+import re
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from listing import (AUCTION_OCCUPIED, DEFAULT_AUCTION_DATE, DEFAULT_CONDITION, DEFAULT_FLOOR,
+                     DEFAULT_TITLE, DEFAULT_TYPE, LISTING_FIELDS)
+
+# parametri di tracciamento che non identificano la pagina
+TRACKING_PARAMS_RE = re.compile(r'^(?:utm_\w+|fbclid|gclid|ref|source|sessionid|sid|jsessionid)$',
+                                re.IGNORECASE)
+LOCATION_TOKEN_RE = re.compile(r"[a-zà-ù0-9]+")
+DATE_PARTS_RE = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')
+
+# valori che i parser usano quando il dato manca
+_PLACEHOLDERS = {
+    'title': DEFAULT_TITLE,
+    'floor': DEFAULT_FLOOR,
+    'condition': DEFAULT_CONDITION,
+    'type': DEFAULT_TYPE,
+    'auction_date': DEFAULT_AUCTION_DATE,
+}
+
+
+def canonical_url(url: Optional[str]) -> str:
+    """
+    URL normalizzato per il confronto: schema e host minuscoli senza www, niente frammento,
+    parametri di tracciamento rimossi e query ordinata. Stringa vuota per gli URL che non
+    identificano un annuncio (home page o pagina di ricerca senza percorso).
+    """
+    if not url:
+        return ''
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    path = parts.path.rstrip('/')
+    if not host or not path:
+        return ''
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not TRACKING_PARAMS_RE.match(k))
+    return urlunsplit(('', host, path, urlencode(query), ''))
+
+
+def _origins(url: str, source: str = '') -> frozenset:
+    """Fonte e host dell'annuncio: annunci con un'origine in comune non si fondono per somiglianza"""
+    origins = set()
+    if source:
+        origins.add(('source', source))
+    if url:
+        origins.add(('host', urlsplit(url).netloc))
+    return frozenset(origins)
+
+
+def _location_tokens(value: Optional[str]) -> Set[str]:
+    return set(LOCATION_TOKEN_RE.findall((value or '').lower()))
+
+
+def _auction_date(value: Optional[str]) -> Optional[Tuple[int, int, int]]:
+    match = DATE_PARTS_RE.match((value or '').strip())
+    if not match:
+        return None
+    day, month, year = (int(part) for part in match.groups())
+    return year, month, day
+
+
+def _informative(field: str, value) -> bool:
+    if field in _PLACEHOLDERS:
+        return bool(value) and value != _PLACEHOLDERS[field]
+    if field in ('price', 'size', 'rooms'):
+        return bool(value) and value > 0
+    return value not in (None, '')
+
+
+def richness(record: Mapping) -> int:
+    """Numero di campi con un valore reale (non mancante né segnaposto)"""
+    return sum(1 for field in LISTING_FIELDS if _informative(field, record.get(field)))
+
+
+def merge_records(first: Mapping, second: Mapping) -> Dict:
+    """Record più ricco come base, completato con i campi che solo l'altro conosce"""
+    if richness(second) > richness(first):
+        first, second = second, first
+    merged = {field: first.get(field) for field in LISTING_FIELDS}
+    for field in LISTING_FIELDS:
+        if not _informative(field, merged[field]) and _informative(field, second.get(field)):
+            merged[field] = second.get(field)
+    # basta una fonte che lo segnali occupato
+    if second.get('auction_type') == AUCTION_OCCUPIED:
+        merged['auction_type'] = AUCTION_OCCUPIED
+    if merged['price_per_m2'] is None and merged['price'] and merged['size']:
+        merged['price_per_m2'] = round(merged['price'] / merged['size'], 2)
+    return merged
+
+
+class Deduplicator:
+    """
+    Raccoglie annunci scartando o fondendo i duplicati.
+    Due annunci sono lo stesso lotto se hanno lo stesso URL canonico, oppure se vengono da
+    fonti e host diversi e hanno prezzi entro `price_tolerance` e almeno `min_evidence`
+    conferme tra superficie, data d'asta e località, senza contraddizioni su nessuna delle tre.
+    """
+
+    def __init__(self, price_tolerance: float = 0.01, size_tolerance: float = 0.05,
+                 min_evidence: int = 2):
+        self.price_tolerance = price_tolerance
+        self.size_tolerance = size_tolerance
+        self.min_evidence = min_evidence
+        self.records: List[Dict] = []
+        self.merged = 0
+        self._by_url: Dict[str, int] = {}
+        # (bucket di prezzo, data) -> indici; e bucket di prezzo -> indici, per chi non ha data
+        self._buckets: Dict[Tuple, List[int]] = {}
+        self._price_buckets: Dict[int, List[int]] = {}
+        # caratteristiche precalcolate per indice: (prezzo, superficie, data, token località, origini)
+        self._features: List[Tuple] = []
+        self._log_step = math.log1p(price_tolerance)
+
+    def _bucket(self, price: float) -> int:
+        return int(math.log(price) / self._log_step)
+
+    @staticmethod
+    def _features_of(record: Mapping, origins: frozenset = frozenset()) -> Tuple:
+        return (record.get('price') or 0.0, record.get('size') or 0.0,
+                _auction_date(record.get('auction_date')), _location_tokens(record.get('location')),
+                origins)
+
+    def _same_lot(self, a: Tuple, b: Tuple) -> bool:
+        price_a, size_a, date_a, loc_a, origins_a = a
+        price_b, size_b, date_b, loc_b, origins_b = b
+        # stesso portale, URL diversi: lotti distinti (ad esempio due box uguali nello stesso stabile)
+        if origins_a & origins_b:
+            return False
+        if abs(price_a - price_b) > self.price_tolerance * max(price_a, price_b):
+            return False
+        evidence = 0
+        if size_a and size_b:
+            if abs(size_a - size_b) > self.size_tolerance * max(size_a, size_b):
+                return False
+            evidence += 1
+        if date_a and date_b:
+            if date_a != date_b:
+                return False
+            evidence += 1
+        if loc_a and loc_b:
+            if not loc_a & loc_b:
+                return False
+            evidence += 1
+        return evidence >= self.min_evidence
+
+    def _candidates(self, features: Tuple) -> Iterable[int]:
+        bucket, date = self._bucket(features[0]), features[2]
+        for neighbour in (bucket - 1, bucket, bucket + 1):
+            if date is None:
+                yield from self._price_buckets.get(neighbour, ())
+            else:
+                yield from self._buckets.get((neighbour, date), ())
+                yield from self._buckets.get((neighbour, None), ())
+
+    def _find(self, url: str, features: Tuple) -> Optional[int]:
+        if url and url in self._by_url:
+            return self._by_url[url]
+        if features[0] <= 0:
+            return None
+        for i in self._candidates(features):
+            if self._same_lot(features, self._features[i]):
+                return i
+        return None
+
+    def _index(self, i: int, url: str, features: Tuple) -> None:
+        if url:
+            self._by_url.setdefault(url, i)
+        if features[0] > 0:
+            bucket = self._bucket(features[0])
+            self._buckets.setdefault((bucket, features[2]), []).append(i)
+            self._price_buckets.setdefault(bucket, []).append(i)
+
+    def add(self, record: Mapping, source: str = '') -> bool:
+        """True se l'annuncio è nuovo, False se è stato fuso con uno già visto"""
+        merged = self.merged
+        self.assign(record, source)
+        return self.merged == merged
+
+    def assign(self, record: Mapping, source: str = '') -> int:
+        """Come add, ma restituisce la posizione in `records` del gruppo a cui appartiene l'annuncio"""
+        url = canonical_url(record.get('url'))
+        features = self._features_of(record, _origins(url, source))
+        i = self._find(url, features)
+        if i is None:
+            i = len(self.records)
+            self.records.append(dict(record))
+            self._features.append(features)
+            self._index(i, url, features)
+            return i
+
+        merged = merge_records(self.records[i], record)
+        # il record fuso ha le origini di entrambi: non assorbe altri lotti di nessuna delle due fonti
+        previous = self._features[i]
+        features = self._features_of(merged, previous[4] | features[4])
+        self.records[i] = merged
+        self._features[i] = features
+        # il record fuso resta raggiungibile con l'URL del duplicato e, se cambiano, con prezzo e data nuovi
+        if url:
+            self._by_url.setdefault(url, i)
+        if features[0] != previous[0] or features[2] != previous[2]:
+            self._index(i, '', features)
+        self.merged += 1
+        return i
+
+    def extend(self, records: Iterable[Mapping], source: str = '') -> None:
+        for record in records:
+            self.add(record, source)
+
+
+def deduplicate(records: Iterable[Mapping], **options) -> List[Dict]:
+    """Annunci senza duplicati, nell'ordine della prima occorrenza"""
+    dedup = Deduplicator(**options)
+    dedup.extend(records)
+    return dedup.records
@@ -0,0 +1,174 @@
+"""
+IVG Real Estate - Estrattori per fonte
+Ogni fonte di IVGScraper.SOURCES può dichiarare con la chiave 'extract' le proprie regole
+di estrazione (JSON-LD, dati in una variabile JavaScript, selettore delle card), costruite
+una volta sola alla definizione della fonte. Dopo le regole della fonte restano le
+strategie generiche; l'estrattore ricorda quale strategia ha funzionato l'ultima volta e
+alla pagina successiva la prova per prima, senza ripetere le scansioni che falliscono.
+"""
+
+import json
+import re
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+import profiling
+from listing import Listing
+
+JSON_BLOB_RE = re.compile(r'(\{.*\}|\[.*\])', re.DOTALL)
+SCRIPT_MARKERS = ('window.__DATA__', 'window.initialData', 'var listings')
+
+
+def class_string(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return ' '.join(value)
+    return value or ''
+
+
+def ld_json_blobs(soup) -> Iterator:
+    """Contenuto JSON (dict o lista) degli script application/ld+json"""
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            data = json.loads(script.string)
+        except Exception:
+            continue
+        if isinstance(data, (dict, list)):
+            yield data
+
+
+def script_blobs(soup, markers: Sequence[str] = SCRIPT_MARKERS) -> Iterator:
+    """JSON assegnato a una variabile negli script che contengono uno dei marcatori"""
+    for script in soup.find_all('script'):
+        txt = script.string
+        if not txt or not any(marker in txt for marker in markers):
+            continue
+        match = JSON_BLOB_RE.search(txt)
+        if match:
+            try:
+                yield json.loads(match.group(1))
+            except Exception:
+                continue
+
+
+class Strategy:
+    """Un modo di estrarre gli annunci da una pagina; `path` è l'etichetta in ivg_parse_path_total"""
+
+    path = 'none'
+    stage = 'extract'  # fase nell'header Server-Timing delle ricerche profilate
+
+    def key(self) -> Tuple:
+        raise NotImplementedError
+
+    def extract(self, scraper, soup, base_url: str, source_name: str) -> List[Listing]:
+        raise NotImplementedError
+
+    def admits(self, name: str, attrs) -> bool:
+        """True se il tag serve alla strategia (parsing mirato: solo questi tag vengono costruiti)"""
+        return False
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}{self.key()[1:]!r}"
+
+
+class JsonLd(Strategy):
+    """Annunci in uno script application/ld+json (ItemList di schema.org o simili)"""
+
+    path = 'json'
+    stage = 'json'
+
+    def key(self) -> Tuple:
+        return ('json_ld',)
+
+    def extract(self, scraper, soup, base_url: str, source_name: str) -> List[Listing]:
+        for data in ld_json_blobs(soup):
+            properties = scraper._parse_json_data(data, base_url, None, None, None, None, None, None)
+            if properties:
+                return properties
+        return []
+
+
+class ScriptData(Strategy):
+    """Annunci in un oggetto JSON assegnato a una variabile JavaScript (window.__DATA__...)"""
+
+    path = 'json'
+    stage = 'json'
+
+    def __init__(self, markers: Sequence[str] = SCRIPT_MARKERS):
+        self.markers = tuple(markers)
+
+    def key(self) -> Tuple:
+        return ('script', self.markers)
+
+    def extract(self, scraper, soup, base_url: str, source_name: str) -> List[Listing]:
+        for data in script_blobs(soup, self.markers):
+            properties = scraper._parse_json_data(data, base_url, None, None, None, None, None, None)
+            if properties:
+                return properties
+        return []
+
+
+class Cards(Strategy):
+    """
+    Card HTML individuate da tag e classe (nome esatto di una classe oppure regex) ed
+    eventuali attributi: una sola scansione del documento.
+    """
+
+    path = 'html'
+    stage = 'cards'
+
+    def __init__(self, tags: Union[str, Sequence[str]], class_=None, attrs: Optional[dict] = None):
+        self.tags = (tags,) if isinstance(tags, str) else tuple(tags)
+        self.class_ = class_
+        self.attrs = dict(attrs or {})
+        self._find = dict(attrs=self.attrs)
+        if class_ is not None:
+            self._find['class_'] = class_
+
+    def key(self) -> Tuple:
+        pattern = self.class_.pattern if hasattr(self.class_, 'pattern') else self.class_
+        return ('cards', self.tags, pattern, tuple(sorted(self.attrs.items())))
+
+    def extract(self, scraper, soup, base_url: str, source_name: str) -> List[Listing]:
+        cards = soup.find_all(list(self.tags), **self._find)
+        return scraper._parse_cards(cards, base_url, source_name) if cards else []
+
+    def admits(self, name: str, attrs) -> bool:
+        if name not in self.tags:
+            return False
+        attrs = attrs or {}
+        for attr, expected in self.attrs.items():
+            if attr not in attrs or (expected is not True and attrs[attr] != expected):
+                return False
+        if self.class_ is None:
+            return True
+        css = class_string(attrs.get('class'))
+        if isinstance(self.class_, str):
+            return self.class_ in css.split()
+        return bool(self.class_.search(css))
+
+
+class SourceExtractor:
+    """
+    Strategie di una fonte in ordine di prova: regole della fonte, poi quelle generiche
+    non già presenti. L'ultima strategia riuscita viene provata per prima.
+    """
+
+    def __init__(self, rules: Sequence[Strategy] = (), generic: Sequence[Strategy] = ()):
+        self.rules = tuple(rules)
+        keys = {rule.key() for rule in self.rules}
+        self.strategies = self.rules + tuple(s for s in generic if s.key() not in keys)
+        self.last: Optional[Strategy] = None
+
+    def extract(self, scraper, soup, base_url: str, source_name: str) -> Tuple[str, List[Listing]]:
+        last = self.last
+        order = self.strategies if last is None else (last,) + tuple(s for s in self.strategies if s is not last)
+        for strategy in order:
+            with profiling.stage(strategy.stage):
+                properties = strategy.extract(scraper, soup, base_url, source_name)
+            if properties:
+                # assegnazione atomica: basta anche con più thread sulla stessa fonte
+                self.last = strategy
+                return strategy.path, properties
+        return 'none', []
+
+    def admits(self, name: str, attrs) -> bool:
+        return any(rule.admits(name, attrs) for rule in self.rules)
@@ -0,0 +1,125 @@
+"""
+IVG Real Estate - Ricerca testuale
+Analisi del testo in italiano (minuscole, senza accenti, stopword, stemming leggero) e
+punteggio BM25 per il parametro q= di /api/search. L'indice locale usa gli stessi termini
+in una tabella SQLite FTS5; sui risultati live il BM25 si calcola sugli annunci trovati.
+"""
+
+import math
+import re
+from functools import lru_cache
+from typing import Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from geo import fold
+
+# campi dell'annuncio indicizzati per la ricerca testuale
+TEXT_SEARCH_FIELDS = ('title', 'description', 'type', 'condition')
+
+# punti di classifica per l'annuncio più pertinente alla query (gli altri in proporzione)
+TEXT_POINTS = 20
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset('''
+a ad al alla alle allo agli ai all c che chi ci con col coi da dal dalla dalle dallo dagli dai
+dall degli dei del della delle dello di e ed gli i il in l la le lo ma mi ne nel nella nelle
+nello negli nei nell non o od per piu se si sia sono su sul sulla sulle sullo sugli sui
+sull tra fra un una uno ha hanno anche come dove questo questa quello quella
+'''.split())
+
+# suffissi flessivi di verbi e participi ("ristrutturare", "ristrutturato" -> "ristruttur")
+VERB_SUFFIXES = ('are', 'ere', 'ire', 'ato', 'ata', 'ati', 'ate', 'ito', 'ita', 'iti', 'ite',
+                 'uto', 'uta', 'uti', 'ute')
+MIN_STEM = 4
+
+
+def stem(word: str) -> str:
+    """
+    Stemming leggero per l'italiano: solo desinenze flessive, così singolare/plurale e
+    maschile/femminile coincidono ("appartamento", "appartamenti" -> "appartament")
+    senza unire parole di significato diverso.
+    """
+    if len(word) < 4 or word.isdigit():
+        return word
+    for suffix in VERB_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    if word.endswith('io') and len(word) > 5:
+        return word[:-2]
+    if word[-1] in 'aeio':
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def analyze(text: Optional[str]) -> Tuple[str, ...]:
+    """Termini indicizzati di un testo (memo: tipologie e stati si ripetono in ogni annuncio)"""
+    if not text:
+        return ()
+    return tuple(stem(token) for token in TOKEN_RE.findall(fold(text)) if token not in STOPWORDS)
+
+
+def query_terms(q: Optional[str]) -> Tuple[str, ...]:
+    """Termini distinti della query, nell'ordine in cui compaiono"""
+    return tuple(dict.fromkeys(analyze(q)))
+
+
+def document_terms(record: Mapping) -> List[str]:
+    terms: List[str] = []
+    for field in TEXT_SEARCH_FIELDS:
+        terms.extend(analyze(record.get(field)))
+    return terms
+
+
+def matches(record: Mapping, terms: Sequence[str]) -> bool:
+    """True se l'annuncio contiene almeno uno dei termini"""
+    wanted = set(terms)
+    return any(not wanted.isdisjoint(analyze(record.get(field))) for field in TEXT_SEARCH_FIELDS)
+
+
+def fts_query(terms: Sequence[str]) -> str:
+    """Espressione MATCH di FTS5: almeno uno dei termini, ciascuno tra virgolette"""
+    return ' OR '.join(f'"{term}"' for term in terms)
+
+
+def bm25_scores(documents: Iterable[Sequence[str]], terms: Sequence[str],
+                k1: float = BM25_K1, b: float = BM25_B) -> List[float]:
+    """Punteggio BM25 di ogni documento (lista di termini) rispetto ai termini della query"""
+    wanted = set(terms)
+    lengths: List[int] = []
+    frequencies: List[dict] = []
+    df = dict.fromkeys(wanted, 0)
+    for doc in documents:
+        tf: dict = {}
+        for term in doc:
+            if term in wanted:
+                tf[term] = tf.get(term, 0) + 1
+        for term in tf:
+            df[term] += 1
+        lengths.append(len(doc))
+        frequencies.append(tf)
+
+    n = len(lengths)
+    if not n:
+        return []
+    avgdl = (sum(lengths) / n) or 1.0
+    idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+    scores = []
+    for length, tf in zip(lengths, frequencies):
+        norm = k1 * (1 - b + b * length / avgdl)
+        scores.append(sum(idf[term] * f * (k1 + 1) / (f + norm) for term, f in tf.items()))
+    return scores
+
+
+def relevance(documents: Iterable[Sequence[str]], terms: Sequence[str]) -> List[float]:
+    """BM25 normalizzato in [0, 1] rispetto all'annuncio più pertinente dell'insieme"""
+    scores = bm25_scores(documents, terms)
+    best = max(scores, default=0.0)
+    return [score / best for score in scores] if best > 0 else [0.0] * len(scores)
+
+
+def text_points(relevance_value: float) -> int:
+    return int(min(TEXT_POINTS, relevance_value * TEXT_POINTS))
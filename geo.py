@@ -0,0 +1,200 @@
+"""
+IVG Real Estate - Geolocalizzazione offline
+Gazetteer dei comuni italiani incluso nel repository (data/gazetteer_it.csv: tutti i
+capoluoghi di provincia e i comuni più grandi, coordinate del centro comunale) e
+griglia spaziale a celle fisse per le ricerche per raggio sull'indice locale.
+"""
+
+import csv
+import math
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer_it.csv')
+
+# nomi alternativi usati dai portali -> nome nel gazetteer
+ALIASES = {
+    "reggio nell emilia": 'Reggio Emilia',
+    'reggio di calabria': 'Reggio Calabria',
+    'bolzano bozen': 'Bolzano',
+    'bozen': 'Bolzano',
+    'monza e brianza': 'Monza',
+    'pesaro e urbino': 'Pesaro',
+    'forli cesena': 'Forlì',
+    'massa carrara': 'Massa',
+    'barletta andria trani': 'Barletta',
+    'sud sardegna': 'Carbonia',
+}
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+SEPARATORS_RE = re.compile(r"[’'`\-/]")
+ACCENTED_RE = re.compile('[\u00c0-\u024f]')
+CAPITALIZED_RE = re.compile(r'\b[A-Z\u00c0-\u00de]')
+PROVINCE_CODE_RE = re.compile(r'\(([A-Z]{2})\)|^\s*([A-Z]{2})\s*$')
+# nomi di città usati come nomi di strade: "Via Roma", "Corso Torino"...
+STREET_PREFIX_RE = re.compile(
+    r'(?:\b(?:via|viale|v\.le|corso|c\.so|piazza|p\.zza|piazzale|largo|vicolo|strada|borgo|'
+    r'lungomare|lungotevere|galleria|contrada)\s+(?:[a-z]+\s+){0,2})$')
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+# griglia: celle di 0.1° (circa 11 x 8 km alle nostre latitudini), numerate riga per riga
+CELL_DEG = 0.1
+_CELLS_PER_ROW = int(round(360 / CELL_DEG))
+_ROWS = int(round(180 / CELL_DEG))
+# oltre questo numero di righe la query usa un solo intervallo che le contiene tutte
+# (SQLite limita la profondità delle espressioni, e un OR per riga la supererebbe)
+MAX_CELL_RANGES = 200
+
+
+class Place(NamedTuple):
+    name: str
+    province: str
+    region: str
+    lat: float
+    lon: float
+
+
+def _base_letter(char: str) -> str:
+    base = ''.join(c for c in unicodedata.normalize('NFKD', char) if not unicodedata.combining(c))
+    return base if len(base) == 1 else char
+
+
+# lettere accentate latine -> lettera base, un carattere per uno
+_FOLD_TABLE = {code: _base_letter(chr(code)) for code in range(0xC0, 0x250)}
+
+
+def _fold_chars(text: str) -> str:
+    # carattere per carattere (stessa lunghezza del testo): le posizioni restano confrontabili
+    if ACCENTED_RE.search(text):
+        text = text.translate(_FOLD_TABLE)
+    return SEPARATORS_RE.sub(' ', text.lower())
+
+
+def fold(text: str) -> str:
+    """Minuscolo, senza accenti né apostrofi, spazi compattati: 'Forlì' -> 'forli'"""
+    return ' '.join(_fold_chars(text).split())
+
+
+class Gazetteer:
+    def __init__(self, path: str = GAZETTEER_PATH):
+        self.places: Dict[str, Place] = {}
+        self.provinces: Dict[str, Place] = {}
+        with open(path, encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                place = Place(row['comune'], row['provincia'], row['regione'],
+                              float(row['lat']), float(row['lon']))
+                self.places[fold(place.name)] = place
+                if row['capoluogo'] == '1':
+                    # con più capoluoghi (BT) vale il primo
+                    self.provinces.setdefault(place.province, place)
+        for alias, name in ALIASES.items():
+            self.places.setdefault(alias, self.places[fold(name)])
+        # nomi cercati come sequenze di parole: al più tante parole quante il nome più lungo
+        self._max_words = max(len(name.split()) for name in self.places)
+        self._first_words = {name.split()[0] for name in self.places}
+
+    def match_name(self, text: Optional[str], proper_noun: bool = False) -> Optional[Place]:
+        """
+        Comune citato per nome nel testo (il nome più lungo vince, i nomi di strade sono
+        ignorati). Con proper_noun=True il nome deve iniziare con la maiuscola (testo libero
+        delle card: "prato" non è Prato).
+        """
+        if not text:
+            return None
+        folded = _fold_chars(text)
+        aligned = len(folded) == len(text)
+        # inizi di parola candidati: con proper_noun solo le parole maiuscole del testo originale
+        starts = (CAPITALIZED_RE.finditer(text) if proper_noun and aligned else WORD_RE.finditer(folded))
+        for match in starts:
+            start = match.start()
+            first = WORD_RE.match(folded, start)
+            if first is None or first.group(0) not in self._first_words:
+                continue
+            # il nome più lungo che inizia con questa parola
+            words = WORD_RE.findall(folded, start, start + 60)[:self._max_words]
+            for n in range(len(words), 0, -1):
+                place = self.places.get(' '.join(words[:n]))
+                if place is not None:
+                    break
+            # basta guardare le poche parole prima del nome
+            if place is not None and not STREET_PREFIX_RE.search(folded[max(0, start - 40):start]):
+                return place
+        return None
+
+    def find(self, text: Optional[str]) -> Optional[Place]:
+        """Comune citato nel testo, altrimenti il capoluogo della sigla di provincia"""
+        if not text:
+            return None
+        place = self.match_name(text)
+        if place is not None:
+            return place
+        code = PROVINCE_CODE_RE.search(text)
+        if code:
+            return self.provinces.get(code.group(1) or code.group(2))
+        return None
+
+
+_gazetteer: Optional[Gazetteer] = None
+
+
+def get_gazetteer() -> Gazetteer:
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = Gazetteer()
+    return _gazetteer
+
+
+@lru_cache(maxsize=8192)
+def geocode(location: Optional[str]) -> Optional[Tuple[float, float]]:
+    """(lat, lon) di una località, None se non riconosciuta (le stringhe si ripetono: memo)"""
+    place = get_gazetteer().find(location)
+    return (place.lat, place.lon) if place else None
+
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def geocell(lat: float, lon: float) -> int:
+    """Numero della cella di griglia che contiene il punto"""
+    return int((lat + 90) / CELL_DEG) * _CELLS_PER_ROW + int((lon + 180) / CELL_DEG)
+
+
+def cell_ranges(center: Tuple[float, float], radius_km: float) -> List[Tuple[int, int]]:
+    """
+    Intervalli [da, a] di celle che coprono il cerchio: una riga della griglia è un
+    intervallo contiguo, quindi la query usa l'indice con un BETWEEN per riga. Righe e
+    colonne sono limitate alla griglia; righe intere consecutive sono un solo intervallo.
+    """
+    lat, lon = center
+    dlat = radius_km / KM_PER_DEGREE
+    # longitudine: si usa il parallelo più lontano dall'equatore, dove i gradi sono più corti
+    widest = min(89.9, max(abs(lat - dlat), abs(lat + dlat)))
+    dlon = radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+    first_row = max(0, int((lat - dlat + 90) / CELL_DEG))
+    last_row = min(_ROWS, int((lat + dlat + 90) / CELL_DEG))
+    if dlon >= 180:
+        return [(first_row * _CELLS_PER_ROW, (last_row + 1) * _CELLS_PER_ROW - 1)]
+    first_col = max(0, int((lon - dlon + 180) / CELL_DEG))
+    last_col = min(_CELLS_PER_ROW - 1, int((lon + dlon + 180) / CELL_DEG))
+    ranges = [(row * _CELLS_PER_ROW + first_col, row * _CELLS_PER_ROW + last_col)
+              for row in range(first_row, last_row + 1)]
+    if len(ranges) > MAX_CELL_RANGES:
+        # più celle del necessario, ma la distanza esatta si verifica comunque dopo
+        return [(ranges[0][0], ranges[-1][1])]
+    return ranges
+
+
+def distance_points(distance_km: float, radius_km: float) -> int:
+    """Punti località in base alla distanza: 20 al centro, 6 sul bordo del raggio"""
+    if distance_km > radius_km:
+        return 0
+    return int(round(20 - 14 * distance_km / radius_km))
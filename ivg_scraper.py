@@ -4,30 +4,261 @@ Scraper robusto con multiple fonti e metodi di fallback
 """
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
 import re
-import json
-from typing import List, Dict, Optional
-from urllib.parse import urljoin
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+from collections import OrderedDict
+from concurrent.futures import (Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED,
+                                TimeoutError as FuturesTimeout)
+import hashlib
+import threading
 import time
 
+import metrics
+import profiling
+from dedup import Deduplicator
+from extractors import (Cards, JsonLd, ScriptData, SourceExtractor, class_string, ld_json_blobs,
+                        script_blobs)
+from fulltext import matches, query_terms, text_points
+from geo import distance_points, geocode, get_gazetteer, haversine_km
+from listing import (AUCTION_FREE, AUCTION_OCCUPIED, DEFAULT_AUCTION_DATE, DEFAULT_CONDITION,
+                     DEFAULT_FLOOR, DEFAULT_TITLE, DEFAULT_TYPE, Listing, ListingColumns)
+from source_health import HealthTracker
+
+
+# paginazione dei risultati
+PAGINATION_CLASS_RE = re.compile(r'paginat|paginazione|pager|pagine', re.IGNORECASE)
+NEXT_CLASS_RE = re.compile(r'\bnext\b|successiv|pagination-next', re.IGNORECASE)
+NEXT_TEXT_RE = re.compile(r'^(?:successiva|successivo|avanti|next|›|»|>)$', re.IGNORECASE)
+
+# selettori delle card (compilati una volta sola a livello di modulo)
+CARD_CLASS_RE = re.compile(r'asta|lotto|property|immobile|card|risultato|inserzione', re.IGNORECASE)
+LISTING_ITEM_CLASS_RE = re.compile(r'asta|property|lotto', re.IGNORECASE)
+CARD_SELECTORS = [
+    {'class_': CARD_CLASS_RE},
+    {'class_': 'result-item'},
+    {'class_': 'listing'},
+    {'attrs': {'data-id': True}},
+    {'attrs': {'data-lotto': True}}
+]
+
+# catena generica, usata dopo le regole 'extract' della fonte (e per le fonti senza regole)
+GENERIC_STRATEGIES = (
+    JsonLd(),
+    ScriptData(),
+    *(Cards('div', **selector) for selector in CARD_SELECTORS),
+    Cards(('article', 'li'), LISTING_ITEM_CLASS_RE),
+)
+
+# campi del frontend -> parametri di ricerca del portale, nell'ordine della query string;
+# ogni fonte può sovrascriverli con una chiave 'params' in SOURCES (tupla vuota = non inviato)
+QUERY_PARAMS = {
+    'location': ('comune', 'citta', 'provincia'),
+    'max_price': ('prezzoMax',),
+    'min_size': ('superficieMin',),
+    'home_apartment': ('tipologia',),
+    'stato': ('stato',),
+    'locazione': ('locazione',),
+}
+
+# estrazione dei campi dal testo della card
+PRICE_RE = re.compile(r'€\s*([0-9\.\s]+(?:,[0-9]{2})?)')
+SIZE_RE = re.compile(r'(\d+(?:[\.,]\d+)?)\s*(?:mq|m²|m2|metri)', re.IGNORECASE)
+PROVINCE_RE = re.compile(r'\(([A-Z]{2})\)')
+ROOMS_RE = re.compile(r'(\d+)\s*(?:local|vani|stanze)', re.IGNORECASE)
+FLOOR_RE = re.compile(r'(terra|primo|secondo|terzo|quarto|attico|\d+°?)', re.IGNORECASE)
+CONDITION_RE = re.compile(r'(abitabile|da ristrutturare|nuovo|ottimo stato|buono stato)', re.IGNORECASE)
+TYPE_RE = re.compile(r'(appartamento|casa|attico|villa|loft|bilocale|trilocale)', re.IGNORECASE)
+DATE_RE = re.compile(r'(\d{1,2}/\d{1,2}/\d{4})')
+
+
+def resolve_parser(parser: str = 'auto') -> str:
+    """'auto' sceglie lxml se installato (molto più veloce), altrimenti html.parser"""
+    if parser != 'auto':
+        return parser
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+def _is_listing_tag(name: str, attrs) -> bool:
+    """
+    True per i tag utili allo scraping: script (JSON embedded), contenitori delle card
+    e link di paginazione. Tutto il resto del documento non viene costruito.
+    """
+    if name == 'script':
+        return True
+    attrs = attrs or {}
+    css = class_string(attrs.get('class'))
+    rel = class_string(attrs.get('rel'))
+    if name in ('a', 'link'):
+        return 'next' in rel.split() or (name == 'a' and bool(NEXT_CLASS_RE.search(css)))
+    if name == 'div' and ('data-id' in attrs or 'data-lotto' in attrs):
+        return True
+    if name in ('div', 'article', 'li'):
+        if CARD_CLASS_RE.search(css):
+            return True
+        classes = css.split()
+        if 'result-item' in classes or 'listing' in classes:
+            return True
+    if name in ('nav', 'ul', 'div'):
+        return bool(PAGINATION_CLASS_RE.search(css))
+    return False
+
+
+def build_listing_strainer(extra: Optional[Callable] = None) -> SoupStrainer:
+    """
+    SoupStrainer per il parsing mirato, compatibile con bs4 < 4.13 e >= 4.13.
+    `extra(name, attrs)` ammette altri tag (le card dichiarate nelle regole di una fonte).
+    """
+    if extra is None:
+        allow = _is_listing_tag
+    else:
+        def allow(name, attrs) -> bool:
+            return _is_listing_tag(name, attrs) or extra(name, attrs)
+
+    try:
+        from bs4.filter import ElementFilter  # bs4 >= 4.13
+    except ImportError:
+        return SoupStrainer(lambda name, attrs=None: allow(name, attrs))
+
+    class ListingStrainer(ElementFilter):
+        def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+            return allow(name, attrs)
+
+        def allow_string_creation(self, string) -> bool:
+            # il testo fuori dai tag selezionati non serve
+            return False
+
+    return ListingStrainer()
+
+
+LISTING_STRAINER = build_listing_strainer()
+
 
 class IVGScraper:
     """Scraper migliorato per aste giudiziarie (usa tutti gli input del frontend)"""
+    # 'extract': regole di estrazione della fonte (extractors.py), provate prima della catena generica;
+    # 'params': mappatura dei filtri sui parametri di ricerca del portale (vedi QUERY_PARAMS)
     SOURCES = [
-        {'name': 'astagiudiziaria', 'base_url': 'https://www.astagiudiziaria.com', 'search_url': 'https://www.astagiudiziaria.com/ricerca/immobili'},
-        {'name': 'astegiudiziarie', 'base_url': 'https://www.astegiudiziarie.it', 'search_url': 'https://www.astegiudiziarie.it/immobili'},
-        {'name': 'astalegale', 'base_url': 'https://www.astalegale.net', 'search_url': 'https://www.astalegale.net/risultati-ricerca'}
+        {'name': 'astagiudiziaria', 'base_url': 'https://www.astagiudiziaria.com', 'search_url': 'https://www.astagiudiziaria.com/ricerca/immobili',
+         'extract': [Cards('div', 'risultato-asta')]},
+        {'name': 'astegiudiziarie', 'base_url': 'https://www.astegiudiziarie.it', 'search_url': 'https://www.astegiudiziarie.it/immobili',
+         'extract': [JsonLd(), Cards('li', 'asta-item')]},
+        {'name': 'astalegale', 'base_url': 'https://www.astalegale.net', 'search_url': 'https://www.astalegale.net/risultati-ricerca',
+         'extract': [ScriptData(('window.__DATA__',)), Cards('div', 'inserzione')]}
     ]
 
-    def __init__(self, timeout: int = 10):
-        self.session = requests.Session()
-        self.session.headers.update({
+    # politica HTTP di default; ogni fonte può sovrascriverla con una chiave 'http' in SOURCES
+    HTTP_DEFAULTS = {
+        'pool_connections': 4,
+        'pool_maxsize': 16,
+        'retries': 2,
+        'backoff_factor': 0.3,
+        'status_forcelist': (429, 500, 502, 503, 504),
+        'timeout': None,  # None = usa self.timeout
+    }
+
+    # circuit breaker e timeout adattivi; ogni fonte può sovrascriverli con una chiave 'health'
+    HEALTH_DEFAULTS = {
+        'failure_threshold': 3,
+        'reset_timeout': 60,
+        'min_timeout': 2.0,
+        'timeout_factor': 2.0,
+    }
+
+    MAX_RESULTS = 50  # limite aggregazione
+    MAX_CARDS_PER_PAGE = 200  # protezione contro selettori troppo generici
+    PAGE_CACHE_SIZE = 512  # pagine ricordate per le richieste condizionali
+
+    def __init__(self, timeout: int = 10, concurrent: bool = True,
+                 deadline: Optional[float] = 15.0, polite_delay: float = 0.8,
+                 max_pages: int = 3, page_workers: int = 4,
+                 parser: str = 'auto', targeted_parsing: bool = True,
+                 hedging: bool = True, deduplicate: bool = True):
+        self.timeout = timeout
+        self.session = self._build_session()
+        # concurrent=True interroga tutte le fonti in parallelo entro `deadline` secondi
+        self.concurrent = concurrent
+        self.deadline = deadline
+        # intervallo minimo tra due richieste verso lo stesso host (cortesia verso i portali)
+        self.polite_delay = polite_delay
+        self._host_lock = threading.Lock()
+        self._host_next_slot: Dict[str, float] = {}
+        # paginazione: profondità massima (sovrascrivibile con 'max_pages' in SOURCES)
+        self.max_pages = max_pages
+        self.page_workers = page_workers
+        self._page_cache: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._page_lock = threading.Lock()
+        # motore di parsing: lxml se disponibile; targeted_parsing costruisce solo script e card
+        self.parser = resolve_parser(parser)
+        self.targeted_parsing = targeted_parsing
+        # salute delle fonti: fonti guaste saltate subito, timeout ridotti per quelle lente
+        self.health = HealthTracker(**self.HEALTH_DEFAULTS)
+        # hedging: se una richiesta supera il p90 osservato ne parte una seconda di riserva;
+        # solo le richieste di riserva passano dal pool (la principale parte subito)
+        self.hedging = hedging
+        self._hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ivg-hedge')
+        # deduplicazione tra fonti dei risultati aggregati
+        self.deduplicate = deduplicate
+        # parsing delegato a un pool di processi (crawl massivi, vedi parse_pipeline.ParsePool)
+        self.parse_pool = None
+        # estrattori per fonte (ricordano l'ultima strategia riuscita) e strainer con le loro card
+        self._extractors: Dict[str, SourceExtractor] = {}
+        self._strainers: Dict[str, SoupStrainer] = {}
+        for source in self.SOURCES:
+            extractor = SourceExtractor(source.get('extract') or (), GENERIC_STRATEGIES)
+            self._extractors[source['name']] = extractor
+            if extractor.rules:
+                self._strainers[source['name']] = build_listing_strainer(extractor.admits)
+
+    def _http_config(self, source: Dict) -> Dict:
+        config = dict(self.HTTP_DEFAULTS)
+        config.update(source.get('http') or {})
+        return config
+
+    def _build_session(self) -> requests.Session:
+        """
+        Sessione condivisa con un pool di connessioni keep-alive per ogni portale.
+        Il pool di urllib3 è thread-safe: la stessa istanza può servire più thread gunicorn.
+        """
+        session = requests.Session()
+        session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             'Accept-Language': 'it-IT,it;q=0.9,en;q=0.8',
+            'Connection': 'keep-alive',
         })
-        self.timeout = timeout
+        for source in self.SOURCES:
+            config = self._http_config(source)
+            retry = Retry(
+                total=config['retries'],
+                connect=config['retries'],
+                read=config['retries'],
+                backoff_factor=config['backoff_factor'],
+                status_forcelist=config['status_forcelist'],
+                allowed_methods=frozenset(['GET', 'HEAD']),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=config['pool_connections'],
+                                  pool_maxsize=config['pool_maxsize'],
+                                  max_retries=retry)
+            session.mount(source['base_url'], adapter)
+        return session
+
+    def _source_health(self, source: Dict):
+        return self.health.get(source['name'], **(source.get('health') or {}))
+
+    def _source_timeout(self, source: Dict) -> float:
+        """Timeout adattivo, mai oltre quello configurato per la fonte"""
+        configured = self._http_config(source)['timeout'] or self.timeout
+        return self._source_health(source).timeout(configured)
 
     def search_properties(self,
                           max_price: Optional[float] = None,
@@ -35,113 +266,458 @@ class IVGScraper:
                           location: Optional[str] = None,
                           home_apartment: Optional[str] = None,
                           locazione: Optional[str] = None,
-                          stato: Optional[str] = None) -> List[Dict]:
+                          stato: Optional[str] = None,
+                          radius_km: Optional[float] = None,
+                          q: Optional[str] = None) -> List[Dict]:
         """
         Cerca immobili usando tutte le variabili dal frontend.
+        Con radius_km la località è il centro di una ricerca per distanza; con q restano
+        gli annunci che contengono almeno una delle parole cercate.
         Restituisce lista (vuota se non trova nulla).
         """
-        all_properties: List[Dict] = []
+        filters = dict(max_price=max_price, min_size=min_size, location=location,
+                       home_apartment=home_apartment, locazione=locazione, stato=stato,
+                       radius_km=radius_km, q=q)
+        results: Dict[str, List[Dict]] = {}
+        total = 0
+        for name, properties in self.iter_sources(filters):
+            results[name] = properties
+            total += len(properties)
+            if not self.concurrent and total >= self.MAX_RESULTS:
+                break
 
-        for source in self.SOURCES:
-            try:
+        # NON generiamo dati finti: se non trovi nulla, ritorniamo lista vuota
+        with profiling.stage('dedup'):
+            return self._aggregate(results)
+
+    def iter_sources(self, filters: Dict) -> Iterator[Tuple[str, List[Dict]]]:
+        """
+        Restituisce (nome fonte, immobili) man mano che ogni fonte risponde.
+        In modalità concorrente le fonti sono interrogate in parallelo e quelle
+        che non rispondono entro `deadline` secondi vengono ignorate.
+        """
+        if not self.concurrent:
+            for source in self.SOURCES:
                 print(f"[scraper] Tentativo con {source['name']}...")
-                properties = self._scrape_source(
-                    source,
-                    max_price=max_price,
-                    min_size=min_size,
-                    location=location,
-                    home_apartment=home_apartment,
-                    locazione=locazione,
-                    stato=stato
-                )
-                if properties:
-                    print(f"[scraper] ✓ Trovati {len(properties)} immobili da {source['name']}")
-                    all_properties.extend(properties)
-                    if len(all_properties) >= 50:  # limite aggregazione
-                        break
-                else:
-                    print(f"[scraper] ✗ Nessun risultato da {source['name']}")
-            except Exception as e:
-                print(f"[scraper] Errore con {source['name']}: {e}")
+                yield source['name'], self._scrape_source_safe(source, filters)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=len(self.SOURCES),
+                                      thread_name_prefix='ivg-scraper')
+        futures = {}
+        try:
+            for source in self.SOURCES:
+                print(f"[scraper] Tentativo con {source['name']}...")
+                futures[executor.submit(profiling.bind(self._scrape_source_safe), source, filters)] = source
+            try:
+                for future in as_completed(futures, timeout=self.deadline):
+                    yield futures[future]['name'], future.result()
+            except FuturesTimeout:
+                for future, source in futures.items():
+                    if not future.done():
+                        print(f"[scraper] ✗ {source['name']} oltre la deadline di {self.deadline}s, ignorato")
+                        metrics.SOURCE_DEADLINE_EXCEEDED.inc(source=source['name'])
+        finally:
+            # non aspettiamo le fonti lente: i thread terminano da soli al timeout HTTP
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _scrape_source_safe(self, source: Dict, filters: Dict,
+                            max_pages: Optional[int] = None) -> List[Dict]:
+        if not self._allow_source(source):
+            return []
+        try:
+            properties = self._scrape_source(source, max_pages=max_pages, **filters)
+        except Exception as e:
+            print(f"[scraper] Errore con {source['name']}: {e}")
+            return []
+        finally:
+            # prova half-open senza esito registrato (errore fuori dalla richiesta HTTP)
+            self._source_health(source).release_probe()
+        self._log_outcome(source, properties)
+        return properties
+
+    def _allow_source(self, source: Dict) -> bool:
+        """Consulta il circuit breaker: False se la fonte va saltata"""
+        health = self._source_health(source)
+        allowed = health.allow_request()
+        metrics.SOURCE_CIRCUIT_STATE.set(health.state_code(), source=source['name'])
+        if not allowed:
+            print(f"[scraper] ✗ {source['name']} saltato: circuito aperto")
+            metrics.SOURCE_SKIPPED.inc(source=source['name'])
+        return allowed
+
+    @staticmethod
+    def _log_outcome(source: Dict, properties: List[Dict]) -> None:
+        if properties:
+            print(f"[scraper] ✓ Trovati {len(properties)} immobili da {source['name']}")
+        else:
+            print(f"[scraper] ✗ Nessun risultato da {source['name']}")
+
+    def _aggregate(self, results: Dict[str, List[Dict]]) -> List[Dict]:
+        """
+        Unisce i risultati nell'ordine di SOURCES rispettando il limite di aggregazione.
+        Con deduplicate=True lo stesso lotto pubblicato su più portali occupa un solo posto.
+        """
+        if not self.deduplicate:
+            all_properties: List[Dict] = []
+            for source in self.SOURCES:
+                properties = results.get(source['name'])
+                if not properties:
+                    continue
+                all_properties.extend(properties)
+                if len(all_properties) >= self.MAX_RESULTS:
+                    break
+            return all_properties
+
+        dedup = Deduplicator()
+        for source in self.SOURCES:
+            properties = results.get(source['name'])
+            if not properties:
                 continue
-            time.sleep(0.8)
+            merged = dedup.merged
+            dedup.extend(properties, source['name'])
+            metrics.DUPLICATES.inc(dedup.merged - merged, stage='aggregate')
+            if len(dedup.records) >= self.MAX_RESULTS:
+                break
+        return dedup.records
 
-        # NON generiamo dati finti: se non trovi nulla, ritorniamo lista vuota
-        return all_properties
+    def _wait_for_host(self, url: str) -> None:
+        """Ritardo di cortesia per host: riserva uno slot e attende il proprio turno"""
+        delay = self._reserve_host_slot(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _reserve_host_slot(self, url: str) -> float:
+        """Riserva il prossimo slot libero per l'host e restituisce i secondi di attesa"""
+        host = urlparse(url).netloc
+        with self._host_lock:
+            now = time.monotonic()
+            slot = max(now, self._host_next_slot.get(host, now))
+            self._host_next_slot[host] = slot + self.polite_delay
+        return slot - now
 
     def _scrape_source(self, source: Dict, max_price: Optional[float],
                        min_size: Optional[float], location: Optional[str],
                        home_apartment: Optional[str], locazione: Optional[str],
-                       stato: Optional[str]) -> List[Dict]:
+                       stato: Optional[str], max_pages: Optional[int] = None,
+                       radius_km: Optional[float] = None, q: Optional[str] = None) -> List[Dict]:
         properties: List[Dict] = []
         try:
-            params = {}
-            # proviamo a mappare i campi ai parametri di ricerca comuni dei siti
-            if location:
-                params.update({'comune': location, 'citta': location, 'provincia': location})
-            if max_price:
-                params['prezzoMax'] = int(max_price)
-            if min_size:
-                params['superficieMin'] = int(min_size)
-            # tipologia / stato possono anche essere passati come parametri (se il sito li supporta)
-            if home_apartment:
-                params['tipologia'] = home_apartment
-            if stato:
-                params['stato'] = stato
-            if locazione:
-                params['locazione'] = locazione
-
-            response = self.session.get(source['search_url'], params=params or None, timeout=self.timeout)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            # Prima prova: JSON embedded
-            json_data = self._extract_json_data(soup)
-            if json_data:
-                properties = self._parse_json_data(json_data, source['base_url'],
-                                                   max_price, min_size, location,
-                                                   home_apartment, locazione, stato)
-
-            # Seconda: parsing HTML
-            if not properties:
-                properties = self._parse_html_listings(soup, source['base_url'],
-                                                       max_price, min_size, location,
-                                                       home_apartment, locazione, stato)
+            params = self._query_params(max_price, min_size, location, home_apartment, locazione, stato,
+                                        radius_km, source.get('params'))
+            pages = self._crawl_pages(source, params, max_pages or source.get('max_pages') or self.max_pages)
+            with profiling.stage('filter'):
+                properties = self._collect(source, pages, max_price, min_size, location, radius_km, q)
         except Exception as e:
             print(f"[scraper] Errore scraping {source['name']}: {e}")
         return properties
 
-    def _extract_json_data(self, soup) -> Optional[Dict]:
-        # script type application/ld+json
-        for script in soup.find_all('script', type='application/ld+json'):
+    @staticmethod
+    def _query_params(max_price: Optional[float], min_size: Optional[float], location: Optional[str],
+                      home_apartment: Optional[str], locazione: Optional[str],
+                      stato: Optional[str], radius_km: Optional[float] = None,
+                      mapping: Optional[Dict] = None) -> Dict:
+        """Filtri del frontend come parametri di ricerca del portale (QUERY_PARAMS + 'params' della fonte)"""
+        names = dict(QUERY_PARAMS, **(mapping or {}))
+        values = {
+            # nella ricerca per raggio il comune è solo il centro: la distanza si filtra qui
+            'location': location if not radius_km else None,
+            'max_price': int(max_price) if max_price else None,
+            'min_size': int(min_size) if min_size else None,
+            # tipologia / stato possono anche essere passati come parametri (se il sito li supporta)
+            'home_apartment': home_apartment,
+            'stato': stato,
+            'locazione': locazione,
+        }
+        params = {}
+        for field, param_names in names.items():
+            if values.get(field):
+                for name in param_names:
+                    params[name] = values[field]
+        return params
+
+    def _collect(self, source: Dict, pages: List[Dict], max_price: Optional[float],
+                 min_size: Optional[float], location: Optional[str],
+                 radius_km: Optional[float] = None, q: Optional[str] = None) -> List[Dict]:
+        """Annunci delle pagine scaricate che passano i filtri"""
+        terms = query_terms(q)
+        properties = [prop.to_dict() for page in pages for prop in page['properties']
+                      if self._passes_filters(prop, max_price, min_size, location, radius_km, terms)]
+        total = sum(len(page['properties']) for page in pages)
+        metrics.LISTINGS.inc(len(properties), source=source['name'], outcome='kept')
+        metrics.LISTINGS.inc(total - len(properties), source=source['name'], outcome='filtered')
+        return properties
+
+    def _crawl_pages(self, source: Dict, params: Dict, max_pages: int) -> List[Dict]:
+        """
+        Scarica la prima pagina dei risultati e segue i link di paginazione fino a
+        `max_pages` pagine, scaricando in parallelo le pagine scoperte a ogni livello.
+        """
+        first = self._fetch_page(source, source['search_url'], params or None)
+        pages = [first]
+        seen = {first['url']}
+        frontier = first['links']
+        while frontier and len(pages) < max_pages:
+            batch = []
+            for url in frontier:
+                if url not in seen and len(pages) + len(batch) < max_pages:
+                    seen.add(url)
+                    batch.append(url)
+            if not batch:
+                break
+            frontier = []
+            fetch = profiling.bind(self._fetch_page)
+            with ThreadPoolExecutor(max_workers=min(len(batch), self.page_workers),
+                                    thread_name_prefix='ivg-pages') as executor:
+                futures = [executor.submit(fetch, source, url) for url in batch]
+                for future in futures:
+                    try:
+                        page = future.result()
+                    except Exception as e:
+                        print(f"[scraper] Errore pagina successiva {source['name']}: {e}")
+                        continue
+                    pages.append(page)
+                    frontier.extend(page['links'])
+        return pages
+
+    def _fetch_page(self, source: Dict, url: str, params: Optional[Dict] = None) -> Dict:
+        """
+        Scarica e analizza una pagina di risultati con richieste condizionali
+        (ETag/Last-Modified) e hash del contenuto: una pagina invariata non viene
+        riscaricata (304) né rianalizzata (stesso hash).
+        """
+        page_key, cached, headers = self._conditional_request(url, params)
+        timeout = self._source_timeout(source)
+        metrics.SOURCE_TIMEOUT_SECONDS.set(timeout, source=source['name'])
+        self._wait_for_host(url)
+        started = time.perf_counter()
+        try:
+            with profiling.stage('network'):
+                response = self._hedged_get(source, url, params, headers, timeout)
+        except requests.Timeout:
+            self._record_error(source, 'timeout')
+            raise
+        except requests.ConnectionError:
+            self._record_error(source, 'connection_error')
+            raise
+        except Exception:
+            # ChunkedEncodingError, ContentDecodingError, TooManyRedirects...: anche questi
+            # chiudono l'eventuale prova half-open
+            self._record_error(source, 'error')
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            metrics.SOURCE_REQUEST_SECONDS.observe(latency, source=source['name'])
+        self._record_status(source, response.status_code, latency)
+        if response.status_code == 304 and cached:
+            return self._remember_page(page_key, cached)
+        response.raise_for_status()
+        return self._page_from_response(source, page_key, cached, response.content,
+                                        response.url, response.headers)
+
+    def _conditional_request(self, url: str, params: Optional[Dict]) -> Tuple[str, Optional[Dict], Dict]:
+        """URL canonico della pagina, versione in cache e header condizionali da inviare"""
+        page_key = requests.Request('GET', url, params=params).prepare().url
+        with self._page_lock:
+            cached = self._page_cache.get(page_key)
+        headers = {}
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+        return page_key, cached, headers
+
+    def _record_error(self, source: Dict, status: str) -> None:
+        metrics.SOURCE_RESPONSES.inc(source=source['name'], status=status)
+        self._source_health(source).record_failure()
+
+    def _record_status(self, source: Dict, status_code: int, latency: float) -> None:
+        health = self._source_health(source)
+        metrics.SOURCE_RESPONSES.inc(source=source['name'], status=status_code)
+        if status_code >= 500 or status_code == 429:
+            health.record_failure()
+        else:
+            # il portale risponde: un 404 su un link di paginazione è un errore della pagina
+            # (raise_for_status in _fetch_page), non della fonte
+            health.record_success(latency)
+        metrics.SOURCE_CIRCUIT_STATE.set(health.state_code(), source=source['name'])
+
+    def _page_from_response(self, source: Dict, page_key: str, cached: Optional[Dict],
+                            content: bytes, final_url: str, headers) -> Dict:
+        """Analizza il contenuto, oppure riusa la pagina in cache se l'hash non è cambiato"""
+        digest = hashlib.sha1(content).hexdigest()
+        if cached and cached['digest'] == digest:
+            page = dict(cached)
+        else:
+            analyze = self.parse_pool.analyze if self.parse_pool is not None else self._analyze
+            properties, links = analyze(content, source['base_url'], source['name'], str(final_url))
+            page = {
+                'url': page_key,
+                'digest': digest,
+                # in cache restano molte pagine: annunci in forma colonnare
+                'properties': ListingColumns(properties),
+                'links': links,
+            }
+        page['etag'] = headers.get('ETag')
+        page['last_modified'] = headers.get('Last-Modified')
+        return self._remember_page(page_key, page)
+
+    def _get(self, url: str, params: Optional[Dict], headers: Dict, timeout: float) -> requests.Response:
+        return self.session.get(url, params=params, headers=headers or None, timeout=timeout)
+
+    def _hedged_get(self, source: Dict, url: str, params: Optional[Dict], headers: Dict,
+                    timeout: float) -> requests.Response:
+        """
+        GET con hedging: se la risposta non arriva entro il p90 di latenza osservato
+        parte una seconda richiesta identica e vince la prima che risponde.
+        """
+        delay = self._source_health(source).hedge_delay() if self.hedging else None
+        if delay is None or delay >= timeout:
+            return self._get(url, params, headers, timeout)
+
+        # richiesta principale in un thread proprio, avviato subito: nessuna attesa in coda nel
+        # pool condiviso, quindi il timer dell'hedging misura solo la latenza del portale
+        first = self._start_request(url, params, headers, timeout)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        metrics.HEDGED_REQUESTS.inc(source=source['name'], outcome='sent')
+        second = self._hedge_executor.submit(self._get, url, params, headers, timeout)
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is second:
+                    metrics.HEDGED_REQUESTS.inc(source=source['name'], outcome='won')
+                return response
+        raise error
+
+    def _start_request(self, url: str, params: Optional[Dict], headers: Dict, timeout: float) -> Future:
+        """GET in un thread dedicato; il Future si completa con la risposta o con l'errore"""
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
             try:
-                data = json.loads(script.string)
-                if isinstance(data, (dict, list)):
-                    return data
-            except Exception:
+                future.set_result(self._get(url, params, headers, timeout))
+            except BaseException as e:
+                future.set_exception(e)
+
+        # start() ritorna quando il thread è partito: da qui parte il timer dell'hedging
+        threading.Thread(target=run, name='ivg-request', daemon=True).start()
+        return future
+
+    def _analyze(self, content: bytes, base_url: str, source_name: str,
+                 page_url: str) -> Tuple[List[Listing], List[str]]:
+        """Annunci e link di paginazione di una pagina scaricata"""
+        with profiling.stage('soup'):
+            soup = self._make_soup(content, source_name)
+        properties = self._parse_page(soup, base_url, source_name)
+        with profiling.stage('links'):
+            links = self._pagination_links(soup, page_url)
+        return properties, links
+
+    def _make_soup(self, content, source_name: str = '') -> BeautifulSoup:
+        if self.targeted_parsing:
+            strainer = self._strainers.get(source_name, LISTING_STRAINER)
+            return BeautifulSoup(content, self.parser, parse_only=strainer)
+        return BeautifulSoup(content, self.parser)
+
+    def _extractor(self, source_name: str) -> SourceExtractor:
+        extractor = self._extractors.get(source_name)
+        if extractor is None:
+            # fonte non dichiarata in SOURCES: solo la catena generica
+            extractor = self._extractors.setdefault(source_name, SourceExtractor((), GENERIC_STRATEGIES))
+        return extractor
+
+    def _remember_page(self, page_key: str, page: Dict) -> Dict:
+        with self._page_lock:
+            self._page_cache[page_key] = page
+            self._page_cache.move_to_end(page_key)
+            while len(self._page_cache) > self.PAGE_CACHE_SIZE:
+                self._page_cache.popitem(last=False)
+        return page
+
+    def _parse_page(self, soup, base_url: str, source_name: str = '') -> List[Listing]:
+        """
+        Estrae tutti gli annunci di una pagina, senza filtri (applicati dopo): regole della
+        fonte, poi JSON embedded e card generiche, partendo dall'ultima strategia riuscita.
+        """
+        source_name = source_name or self._source_label(base_url)
+        path, properties = self._extractor(source_name).extract(self, soup, base_url, source_name)
+        metrics.PARSE_PATH.inc(source=source_name, path=path)
+        return properties
+
+    def _source_label(self, base_url: str) -> str:
+        for source in self.SOURCES:
+            if source['base_url'] == base_url:
+                return source['name']
+        return urlparse(base_url).netloc
+
+    def _pagination_links(self, soup, page_url: str) -> List[str]:
+        """Link alle pagine successive (rel=next, "Successiva", numeri di pagina) sullo stesso host"""
+        host = urlparse(page_url).netloc
+        links: List[str] = []
+        candidates = soup.find_all(['a', 'link'], rel='next')
+        for container in soup.find_all(['nav', 'ul', 'div'], class_=PAGINATION_CLASS_RE):
+            candidates.extend(container.find_all('a', href=True))
+        candidates.extend(soup.find_all('a', class_=NEXT_CLASS_RE, href=True))
+        for a in candidates:
+            href = a.get('href')
+            if not href or href.startswith(('#', 'javascript:')):
                 continue
-        # script con window.__DATA__ o simili
-        for script in soup.find_all('script'):
-            txt = script.string
-            if not txt:
+            rel = a.get('rel') or []
+            text = a.get_text(strip=True)
+            if 'next' not in rel and not NEXT_TEXT_RE.match(text) and not text.isdigit() \
+                    and not NEXT_CLASS_RE.search(' '.join(a.get('class') or [])):
                 continue
-            if 'window.__DATA__' in txt or 'window.initialData' in txt or 'var listings' in txt:
-                match = re.search(r'(\{.*\}|\[.*\])', txt, re.DOTALL)
-                if match:
-                    try:
-                        return json.loads(match.group(1))
-                    except Exception:
-                        continue
-        return None
+            url = urljoin(page_url, href)
+            if urlparse(url).netloc == host and url != page_url and url not in links:
+                links.append(url)
+        return links
+
+    @staticmethod
+    def _passes_filters(prop: Dict, max_price: Optional[float], min_size: Optional[float],
+                        location: Optional[str], radius_km: Optional[float] = None,
+                        terms: Tuple[str, ...] = ()) -> bool:
+        # i campi mancanti non escludono l'annuncio
+        if max_price and prop.get('price') and prop['price'] > max_price:
+            return False
+        if min_size and prop.get('size') and prop['size'] < min_size:
+            return False
+        # parole cercate prima della località: il ramo del raggio decide e termina il controllo
+        if terms and not matches(prop, terms):
+            return False
+        if location and prop.get('location'):
+            distance = location_distance(prop['location'], location) if radius_km else None
+            if distance is not None:
+                return distance <= radius_km
+            # località non geolocalizzabili: confronto testuale come senza raggio
+            if location.lower() not in prop['location'].lower():
+                return False
+        return True
+
+    def _extract_json_data(self, soup) -> Optional[Dict]:
+        # script type application/ld+json, poi script con window.__DATA__ o simili
+        data = next(ld_json_blobs(soup), None)
+        return data if data is not None else next(script_blobs(soup), None)
 
     def _parse_json_data(self, data: Dict, base_url: str,
                          max_price: Optional[float], min_size: Optional[float], location: Optional[str],
-                         home_apartment: Optional[str], locazione: Optional[str], stato: Optional[str]) -> List[Dict]:
+                         home_apartment: Optional[str], locazione: Optional[str], stato: Optional[str]) -> List[Listing]:
         """
         Tentativo generico di estrazione da JSON embedded.
         Ogni sito ha il suo formato: qui tentiamo di estrarre proprietà standard se presenti.
         """
-        properties: List[Dict] = []
+        properties: List[Listing] = []
 
         try:
             items = []
@@ -217,20 +793,21 @@ class IVGScraper:
                 # calcola price_per_m2
                 price_per_m2 = round(price / size, 2) if price and size else None
 
-                prop = {
-                    'title': title[:200] if title else 'Immobile in asta',
-                    'location': location_field or '',
-                    'price': price,
-                    'price_per_m2': price_per_m2,
-                    'size': size,
-                    'rooms': int(rooms or 0),
-                    'floor': item.get('floor') or 'Non specificato',
-                    'condition': condition or 'Da verificare',
-                    'type': item.get('propertyType') or item.get('type') or home_apartment or 'Immobile',
-                    'auction_type': item.get('occupancy') or ('Occupato' if 'occupato' in (item.get('description') or '').lower() else 'Libero'),
-                    'auction_date': item.get('auctionDate') or item.get('date') or 'Da definire',
-                    'url': url or base_url
-                }
+                prop = Listing(
+                    title=title[:200] if title else DEFAULT_TITLE,
+                    location=location_field or '',
+                    price=price,
+                    price_per_m2=price_per_m2,
+                    size=size,
+                    rooms=int(rooms or 0),
+                    floor=item.get('floor') or DEFAULT_FLOOR,
+                    condition=condition or DEFAULT_CONDITION,
+                    type=item.get('propertyType') or item.get('type') or home_apartment or DEFAULT_TYPE,
+                    auction_type=item.get('occupancy') or (AUCTION_OCCUPIED if 'occupato' in (item.get('description') or '').lower() else AUCTION_FREE),
+                    auction_date=item.get('auctionDate') or item.get('date') or DEFAULT_AUCTION_DATE,
+                    url=url or base_url,
+                    description=str(item.get('description') or '')[:500]
+                )
 
                 # Applica filtri minimi lato parsing per rispettare i criteri richiesti
                 if max_price and prop['price'] and prop['price'] > max_price:
@@ -249,19 +826,9 @@ class IVGScraper:
 
     def _parse_html_listings(self, soup, base_url: str,
                              max_price: Optional[float], min_size: Optional[float], location: Optional[str],
-                             home_apartment: Optional[str], locazione: Optional[str], stato: Optional[str]) -> List[Dict]:
-        properties: List[Dict] = []
-
-        card_selectors = [
-            {'class_': re.compile(r'asta|lotto|property|immobile|card|risultato|inserzione', re.IGNORECASE)},
-            {'class_': 'result-item'},
-            {'class_': 'listing'},
-            {'attrs': {'data-id': True}},
-            {'attrs': {'data-lotto': True}}
-        ]
-
+                             home_apartment: Optional[str], locazione: Optional[str], stato: Optional[str]) -> List[Listing]:
         cards = []
-        for selector in card_selectors:
+        for selector in CARD_SELECTORS:
             try:
                 found = soup.find_all('div', **selector)
             except Exception:
@@ -271,12 +838,21 @@ class IVGScraper:
                 break
 
         if not cards:
-            cards = soup.find_all(['article', 'li'], class_=re.compile(r'asta|property|lotto', re.IGNORECASE))
+            cards = soup.find_all(['article', 'li'], class_=LISTING_ITEM_CLASS_RE)
+
+        return self._parse_cards(cards, base_url, self._source_label(base_url),
+                                 max_price, min_size, location)
 
-        for card in cards[:50]:
+    def _parse_cards(self, cards, base_url: str, source_name: str,
+                     max_price: Optional[float] = None, min_size: Optional[float] = None,
+                     location: Optional[str] = None) -> List[Listing]:
+        properties: List[Listing] = []
+        dropped = max(0, len(cards) - self.MAX_CARDS_PER_PAGE)
+        for card in cards[:self.MAX_CARDS_PER_PAGE]:
             try:
                 prop = self._parse_property_card(card, base_url)
                 if not prop:
+                    dropped += 1
                     continue
                 # filtri
                 if max_price and prop.get('price') and prop['price'] > max_price:
@@ -289,20 +865,23 @@ class IVGScraper:
                 # Non scartiamo rigidamente se mancano campi
                 properties.append(prop)
             except Exception:
+                dropped += 1
                 continue
 
+        metrics.CARDS.inc(min(len(cards), self.MAX_CARDS_PER_PAGE) - dropped, source=source_name, outcome='parsed')
+        metrics.CARDS.inc(dropped, source=source_name, outcome='dropped')
         return properties
 
-    def _parse_property_card(self, card, base_url: str) -> Optional[Dict]:
+    def _parse_property_card(self, card, base_url: str) -> Optional[Listing]:
         """Estrae dati da una singola card, con campi migliorati per frontend"""
         try:
             price_text = card.get_text(" ", strip=True)
             title_elem = card.find(['h2', 'h3', 'h4', 'a'])
-            title = title_elem.get_text(strip=True) if title_elem else "Immobile in asta"
+            title = title_elem.get_text(strip=True) if title_elem else DEFAULT_TITLE
 
             # prezzo (ricerca flessibile)
             price = 0.0
-            price_match = re.search(r'€\s*([0-9\.\s]+(?:,[0-9]{2})?)', price_text)
+            price_match = PRICE_RE.search(price_text)
             if price_match:
                 p = price_match.group(1).strip().replace(' ', '').replace('.', '').replace(',', '.')
                 try:
@@ -312,7 +891,7 @@ class IVGScraper:
 
             # superficie
             size = 0.0
-            size_match = re.search(r'(\d+(?:[\.,]\d+)?)\s*(?:mq|m²|m2|metri)', price_text, re.IGNORECASE)
+            size_match = SIZE_RE.search(price_text)
             if size_match:
                 try:
                     size = float(size_match.group(1).replace(',', '.'))
@@ -321,18 +900,14 @@ class IVGScraper:
 
             price_per_m2 = round(price / size, 2) if price and size else None
 
-            # localita' (tentativi multipli)
+            # localita': comune del gazetteer citato nella card, altrimenti la sigla di provincia
             location = ""
-            loc_match = re.search(r'\(([A-Z]{2})\)', price_text)
-            if loc_match:
+            loc_match = PROVINCE_RE.search(price_text)
+            place = get_gazetteer().match_name(price_text, proper_noun=True)
+            if place and (not loc_match or loc_match.group(1) == place.province):
+                location = place.name
+            elif loc_match:
                 location = loc_match.group(0)
-            else:
-                comuni_pattern = re.compile(
-                    r'\b(Roma|Milano|Napoli|Torino|Palermo|Genova|Bologna|Firenze|Bari|Catania|Venezia|Verona|Reggio\s+Emilia|Modena|Parma|Piacenza|Brescia)\b',
-                    re.IGNORECASE)
-                m = comuni_pattern.search(price_text)
-                if m:
-                    location = m.group(0)
 
             # url
             a = card.find('a', href=True)
@@ -340,7 +915,7 @@ class IVGScraper:
 
             # rooms
             rooms = 0
-            r = re.search(r'(\d+)\s*(?:local|vani|stanze)', price_text, re.IGNORECASE)
+            r = ROOMS_RE.search(price_text)
             if r:
                 try:
                     rooms = int(r.group(1))
@@ -348,50 +923,107 @@ class IVGScraper:
                     rooms = 0
 
             # floor
-            f = re.search(r'(terra|primo|secondo|terzo|quarto|attico|\d+°?)', price_text, re.IGNORECASE)
-            floor = f.group(0).capitalize() if f else 'Non specificato'
+            f = FLOOR_RE.search(price_text)
+            floor = f.group(0).capitalize() if f else DEFAULT_FLOOR
 
             # condition
-            cond = re.search(r'(abitabile|da ristrutturare|nuovo|ottimo stato|buono stato)', price_text, re.IGNORECASE)
-            condition = cond.group(0).capitalize() if cond else 'Da verificare'
+            cond = CONDITION_RE.search(price_text)
+            condition = cond.group(0).capitalize() if cond else DEFAULT_CONDITION
 
             # type
-            t = re.search(r'(appartamento|casa|attico|villa|loft|bilocale|trilocale)', price_text, re.IGNORECASE)
-            type_ = t.group(0).capitalize() if t else 'Immobile'
+            t = TYPE_RE.search(price_text)
+            type_ = t.group(0).capitalize() if t else DEFAULT_TYPE
 
             # auction_type
-            auction_type = 'Occupato' if 'occupato' in price_text.lower() else 'Libero'
+            auction_type = AUCTION_OCCUPIED if 'occupato' in price_text.lower() else AUCTION_FREE
 
             # auction_date
-            d = re.search(r'(\d{1,2}/\d{1,2}/\d{4})', price_text)
-            auction_date = d.group(0) if d else 'Da definire'
-
-            return {
-                'title': title[:200],
-                'location': location,
-                'price': price,
-                'price_per_m2': price_per_m2,
-                'size': size,
-                'rooms': rooms,
-                'floor': floor,
-                'condition': condition,
-                'type': type_,
-                'auction_type': auction_type,
-                'auction_date': auction_date,
-                'url': url
-            }
+            d = DATE_RE.search(price_text)
+            auction_date = d.group(0) if d else DEFAULT_AUCTION_DATE
+
+            return Listing(
+                title=title[:200],
+                location=location,
+                price=price,
+                price_per_m2=price_per_m2,
+                size=size,
+                rooms=rooms,
+                floor=floor,
+                condition=condition,
+                type=type_,
+                auction_type=auction_type,
+                auction_date=auction_date,
+                url=url,
+                description=price_text[:500]
+            )
         except Exception:
             # in caso di problemi sul singolo card, non blocchiamo l'intero scraping
             return None
 
 
+_shared_scraper: Optional[IVGScraper] = None
+_shared_scraper_lock = threading.Lock()
+
+
+def get_shared_scraper() -> IVGScraper:
+    """
+    Scraper unico per processo: riusa sessione e connessioni TCP/TLS verso i portali
+    tra una richiesta e l'altra (e tra i thread dello stesso worker gunicorn).
+    """
+    global _shared_scraper
+    if _shared_scraper is None:
+        with _shared_scraper_lock:
+            if _shared_scraper is None:
+                _shared_scraper = IVGScraper()
+    return _shared_scraper
+
+
+def location_points(prop_location: str, location: str) -> int:
+    prop_loc = prop_location.lower()
+    loc_lower = location.lower()
+    if loc_lower == prop_loc.split(',')[0].strip():
+        return 20
+    elif loc_lower in prop_loc:
+        return 12
+    elif any(w in prop_loc for w in loc_lower.split()):
+        return 6
+    return 0
+
+
+def location_distance(prop_location: str, location: str) -> Optional[float]:
+    """Km tra le due località, None se una delle due non è nel gazetteer"""
+    center, point = geocode(location), geocode(prop_location)
+    if center is None or point is None:
+        return None
+    return haversine_km(center, point)
+
+
+def location_score(prop_location: str, location: str, radius_km: Optional[float] = None) -> int:
+    """Punti località: per distanza se è richiesto un raggio e le località sono note, altrimenti testuali"""
+    if radius_km:
+        distance = location_distance(prop_location, location)
+        if distance is not None:
+            return distance_points(distance, radius_km)
+    return location_points(prop_location, location)
+
+
+def locazione_points(prop_type: str, condition: str, locazione: str) -> int:
+    return 4 if locazione.lower() in (prop_type + ' ' + condition).lower() else 0
+
+
+def stato_points(condition: str, stato: str) -> int:
+    return 4 if stato.lower() in condition.lower() else 0
+
+
 def calculate_match_score(property_data: Dict,
                           max_price: Optional[float],
                           min_size: Optional[float],
                           location: Optional[str],
                           home_apartment: Optional[str] = None,
                           locazione: Optional[str] = None,
-                          stato: Optional[str] = None) -> int:
+                          stato: Optional[str] = None,
+                          radius_km: Optional[float] = None,
+                          text_relevance: float = 0.0) -> int:
     score = 0
 
     # prezzo: meglio se sotto il limite
@@ -407,24 +1039,19 @@ def calculate_match_score(property_data: Dict,
 
     # location
     if location and property_data.get('location'):
-        prop_loc = property_data['location'].lower()
-        loc_lower = location.lower()
-        if loc_lower == prop_loc.split(',')[0].strip():
-            score += 20
-        elif loc_lower in prop_loc:
-            score += 12
-        elif any(w in prop_loc for w in loc_lower.split()):
-            score += 6
+        score += location_score(property_data['location'], location, radius_km)
 
     # locazione (se presente in testo)
     if locazione and property_data.get('type'):
-        if locazione.lower() in (property_data.get('type', '') + ' ' + property_data.get('condition', '')).lower():
-            score += 4
+        score += locazione_points(property_data.get('type', ''), property_data.get('condition', ''), locazione)
 
     # stato
     if stato and property_data.get('condition'):
-        if stato.lower() in property_data['condition'].lower():
-            score += 4
+        score += stato_points(property_data['condition'], stato)
+
+    # pertinenza alla ricerca testuale (BM25 normalizzato sull'insieme dei risultati)
+    if text_relevance:
+        score += text_points(text_relevance)
 
     return min(100, score)
 
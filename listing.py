@@ -0,0 +1,201 @@
+"""
+IVG Real Estate - Rappresentazione compatta degli annunci
+Listing: record con __slots__ e campi categoriali internati, letto come un dizionario.
+ListingColumns: contenitore colonnare (array numerici + codici di vocabolario) per
+insiemi grandi di annunci, come le pagine in cache e i risultati dell'indice locale.
+"""
+
+import sys
+from array import array
+from collections.abc import Mapping
+from operator import attrgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# campi del dizionario "property" atteso dal frontend, nell'ordine dei parser
+LISTING_FIELDS = ('title', 'location', 'price', 'price_per_m2', 'size', 'rooms', 'floor',
+                  'condition', 'type', 'auction_type', 'auction_date', 'url', 'description')
+
+# valori di default ripetuti in quasi tutti gli annunci: una sola copia per processo
+DEFAULT_TITLE = sys.intern('Immobile in asta')
+DEFAULT_FLOOR = sys.intern('Non specificato')
+DEFAULT_CONDITION = sys.intern('Da verificare')
+DEFAULT_TYPE = sys.intern('Immobile')
+DEFAULT_AUCTION_DATE = sys.intern('Da definire')
+AUCTION_FREE = sys.intern('Libero')
+AUCTION_OCCUPIED = sys.intern('Occupato')
+
+# campi con pochi valori distinti: internati nel record, codificati nel contenitore colonnare
+CATEGORICAL_FIELDS = ('location', 'floor', 'condition', 'type', 'auction_type', 'auction_date')
+FLOAT_FIELDS = ('price', 'size', 'price_per_m2')
+TEXT_FIELDS = ('title', 'url', 'description')
+
+# valori di default dei campi (quelli di Listing): omessi nelle risposte compatte
+LISTING_DEFAULTS = {
+    'title': DEFAULT_TITLE, 'location': '', 'price': 0.0, 'price_per_m2': None, 'size': 0.0,
+    'rooms': 0, 'floor': DEFAULT_FLOOR, 'condition': DEFAULT_CONDITION, 'type': DEFAULT_TYPE,
+    'auction_type': AUCTION_FREE, 'auction_date': DEFAULT_AUCTION_DATE, 'url': '', 'description': '',
+}
+
+_FIELD_SET = frozenset(LISTING_FIELDS)
+_values = attrgetter(*LISTING_FIELDS)
+_NAN = float('nan')
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def compact(record: Mapping) -> Dict:
+    """Dizionario senza i campi che hanno il valore di default (il client li ricostruisce)"""
+    return {key: value for key, value in record.items()
+            if key not in LISTING_DEFAULTS or value != LISTING_DEFAULTS[key]}
+
+
+class Listing(Mapping):
+    """
+    Annuncio come record a slot fissi: niente dizionario per istanza e stringhe
+    categoriali condivise. Si legge come un dict (get, [], keys, confronto con dict);
+    to_dict() restituisce la forma JSON del frontend.
+    """
+
+    __slots__ = LISTING_FIELDS
+
+    def __init__(self, title: str = DEFAULT_TITLE, location: str = '', price: float = 0.0,
+                 price_per_m2: Optional[float] = None, size: float = 0.0, rooms: int = 0,
+                 floor: str = DEFAULT_FLOOR, condition: str = DEFAULT_CONDITION,
+                 type: str = DEFAULT_TYPE, auction_type: str = AUCTION_FREE,
+                 auction_date: str = DEFAULT_AUCTION_DATE, url: str = '', description: str = ''):
+        self.title = title
+        self.location = _intern(location)
+        self.price = price
+        self.price_per_m2 = price_per_m2
+        self.size = size
+        self.rooms = rooms
+        self.floor = _intern(floor)
+        self.condition = _intern(condition)
+        self.type = _intern(type)
+        self.auction_type = _intern(auction_type)
+        self.auction_date = _intern(auction_date)
+        self.url = url
+        self.description = description
+
+    @classmethod
+    def from_mapping(cls, data: Mapping) -> 'Listing':
+        return cls(**{field: data[field] for field in LISTING_FIELDS if field in data})
+
+    def to_dict(self) -> Dict:
+        return dict(zip(LISTING_FIELDS, _values(self)))
+
+    def __reduce__(self):
+        # pickle compatto (processi di parsing): classe + tupla dei valori, senza nomi dei campi
+        return Listing, _values(self)
+
+    def __getitem__(self, key):
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(LISTING_FIELDS)
+
+    def __len__(self) -> int:
+        return len(LISTING_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"Listing({self.to_dict()!r})"
+
+
+class ListingColumns:
+    """
+    Insieme di annunci in colonne: prezzo, superficie ed €/m² in array('d'), locali in
+    array('q'), i campi categoriali come codici array('I') su un vocabolario condiviso.
+    Le colonne numeriche si passano a NumPy senza copia (np.frombuffer); gli annunci
+    tornano dizionari solo quando servono (to_dicts, ad esempio per i top-k restituiti).
+    """
+
+    __slots__ = ('_floats', '_rooms', '_codes', '_text', '_vocab', '_vocab_index')
+
+    def __init__(self, records: Iterable[Mapping] = ()):
+        self._floats = {field: array('d') for field in FLOAT_FIELDS}
+        self._rooms = array('q')
+        self._codes = {field: array('I') for field in CATEGORICAL_FIELDS}
+        self._text = {field: [] for field in TEXT_FIELDS}
+        # un vocabolario per tutti i campi categoriali: 'Libero' o 'Roma' esistono una volta sola
+        self._vocab: List = []
+        self._vocab_index: Dict = {}
+        self.extend(records)
+
+    def _code(self, value) -> int:
+        code = self._vocab_index.get(value)
+        if code is None:
+            code = self._vocab_index[value] = len(self._vocab)
+            self._vocab.append(_intern(value))
+        return code
+
+    def append(self, record: Mapping) -> None:
+        get = record.get
+        self._floats['price'].append(float(get('price') or 0.0))
+        self._floats['size'].append(float(get('size') or 0.0))
+        price_per_m2 = get('price_per_m2')
+        self._floats['price_per_m2'].append(_NAN if price_per_m2 is None else float(price_per_m2))
+        self._rooms.append(int(get('rooms') or 0))
+        for field in CATEGORICAL_FIELDS:
+            self._codes[field].append(self._code(get(field)))
+        for field in TEXT_FIELDS:
+            self._text[field].append(get(field))
+
+    def extend(self, records: Iterable[Mapping]) -> None:
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    def row(self, i: int) -> Listing:
+        vocab = self._vocab
+        price_per_m2 = self._floats['price_per_m2'][i]
+        return Listing(
+            title=self._text['title'][i],
+            location=vocab[self._codes['location'][i]],
+            price=self._floats['price'][i],
+            price_per_m2=None if price_per_m2 != price_per_m2 else price_per_m2,
+            size=self._floats['size'][i],
+            rooms=self._rooms[i],
+            floor=vocab[self._codes['floor'][i]],
+            condition=vocab[self._codes['condition'][i]],
+            type=vocab[self._codes['type'][i]],
+            auction_type=vocab[self._codes['auction_type'][i]],
+            auction_date=vocab[self._codes['auction_date'][i]],
+            url=self._text['url'][i],
+            description=self._text['description'][i],
+        )
+
+    def __getitem__(self, i: int) -> Listing:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.row(i)
+
+    def __iter__(self) -> Iterator[Listing]:
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def to_dicts(self, indices: Optional[Sequence[int]] = None) -> List[Dict]:
+        """Forma JSON del frontend, per tutti gli annunci o solo per gli indici indicati"""
+        rows = range(len(self)) if indices is None else indices
+        return [self.row(i).to_dict() for i in rows]
+
+    def floats(self, field: str) -> array:
+        """Colonna numerica (price, size, price_per_m2; NaN per i valori mancanti)"""
+        return self._floats[field]
+
+    def rooms(self) -> array:
+        return self._rooms
+
+    def codes(self, field: str) -> Tuple[array, List]:
+        """(codici, vocabolario) di un campo categoriale: vocabolario[codice] è il valore"""
+        return self._codes[field], self._vocab
+
+    def text(self, field: str) -> List:
+        return self._text[field]
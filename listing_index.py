@@ -0,0 +1,487 @@
+"""
+IVG Real Estate - Indice locale degli annunci
+Crawler in background che scarica periodicamente le pagine dei portali in SQLite,
+così /api/search risponde dall'indice senza contattare i siti in modo sincrono
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from dedup import Deduplicator, richness
+from fulltext import document_terms, fts_query, matches, query_terms
+from geo import cell_ranges, geocell, geocode, haversine_km
+from ivg_scraper import IVGScraper, get_shared_scraper
+from listing import LISTING_FIELDS, Listing, ListingColumns
+from parse_pipeline import ParsePool, default_workers
+
+# colonne aggiunte dopo la prima versione dello schema: (nome, tipo)
+ADDED_COLUMNS = (('lat', 'REAL'), ('lon', 'REAL'), ('geocell', 'INTEGER'),
+                 ('description', 'TEXT'), ('terms', 'TEXT'), ('fingerprint', 'TEXT'),
+                 ('cluster', 'TEXT'))
+
+# colonne che descrivono l'annuncio: il loro hash (fingerprint) cambia solo se cambia l'annuncio
+CONTENT_COLUMNS = ('title', 'location', 'price', 'price_per_m2', 'size', 'rooms', 'floor', 'condition',
+                   'type', 'auction_type', 'auction_date', 'url', 'description')
+
+# indice testuale FTS5 sui termini già analizzati (stemming italiano in fulltext.py),
+# tenuto allineato alla tabella dai trigger; il rowid di listings non cambia senza VACUUM
+FTS_SCHEMA = '''
+    CREATE VIRTUAL TABLE listings_fts USING fts5(terms, content='listings', content_rowid='rowid');
+    CREATE TRIGGER listings_fts_insert AFTER INSERT ON listings BEGIN
+        INSERT INTO listings_fts (rowid, terms) VALUES (new.rowid, new.terms);
+    END;
+    CREATE TRIGGER listings_fts_delete AFTER DELETE ON listings BEGIN
+        INSERT INTO listings_fts (listings_fts, rowid, terms) VALUES ('delete', old.rowid, old.terms);
+    END;
+    CREATE TRIGGER listings_fts_update AFTER UPDATE OF terms ON listings BEGIN
+        INSERT INTO listings_fts (listings_fts, rowid, terms) VALUES ('delete', old.rowid, old.terms);
+        INSERT INTO listings_fts (rowid, terms) VALUES (new.rowid, new.terms);
+    END;
+    INSERT INTO listings_fts (listings_fts) VALUES ('rebuild');
+'''
+
+# change log: una riga per annuncio nuovo o con fingerprint cambiato, in ordine di seq;
+# le ricerche salvate leggono solo le righe successive al proprio cursore
+CHANGES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS listing_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT NOT NULL,
+        change TEXT NOT NULL,
+        changed_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_listing_changes_changed_at ON listing_changes (changed_at);
+    CREATE TRIGGER IF NOT EXISTS listing_changes_insert AFTER INSERT ON listings BEGIN
+        INSERT INTO listing_changes (key, change, changed_at) VALUES (new.key, 'new', new.last_seen);
+    END;
+    CREATE TRIGGER IF NOT EXISTS listing_changes_update AFTER UPDATE OF fingerprint ON listings
+    WHEN new.fingerprint IS NOT old.fingerprint BEGIN
+        INSERT INTO listing_changes (key, change, changed_at) VALUES (new.key, 'changed', new.last_seen);
+    END;
+'''
+
+# duplicati tra portali, raggruppati dal crawler: listings.cluster è la chiave del
+# rappresentante del gruppo (NULL = annuncio senza duplicati) e qui c'è la scheda fusa
+# dei gruppi con più annunci, letta dalle ricerche al posto di quella del rappresentante
+CLUSTERS_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS listing_clusters (
+        key TEXT PRIMARY KEY,
+        {', '.join(CONTENT_COLUMNS)}
+    );
+'''
+
+
+def listing_key(source: str, prop: Dict, base_url: str = '') -> str:
+    """Chiave stabile di un annuncio: l'URL, oppure un hash dei campi se il link manca"""
+    url = prop.get('url') or ''
+    if url and url.rstrip('/') != base_url.rstrip('/'):
+        return url
+    raw = '|'.join(str(prop.get(f, '')) for f in ('title', 'location', 'price', 'size', 'auction_date'))
+    return f"{source}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+
+def fingerprint(content) -> str:
+    """Hash dei valori di CONTENT_COLUMNS, nello stesso ordine"""
+    return hashlib.sha1('\x1f'.join(map(str, content)).encode('utf-8')).hexdigest()
+
+
+def _normalize_location(value: Optional[str]) -> str:
+    return ' '.join((value or '').split()).lower()
+
+
+class ListingIndex:
+    """
+    Archivio SQLite degli annunci con indici su prezzo, superficie ed €/m².
+    Le coordinate (dal gazetteer) sono indicizzate per cella di griglia: la ricerca per
+    raggio legge solo le celle che coprono il cerchio e poi verifica la distanza esatta.
+    La ricerca testuale usa FTS5 quando SQLite lo include, altrimenti un filtro in Python.
+    """
+
+    # come i filtri dei parser: la località cercata è contenuta in quella dell'annuncio
+    # ("Emilia" trova "Reggio Emilia"); una scansione di location_norm costa pochi ms
+    _LOCATION_MATCH = "(instr(location_norm, ?) > 0 OR location_norm = '')"
+
+    def __init__(self, path: str = 'listings.sqlite3'):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS listings (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                title TEXT, location TEXT, location_norm TEXT NOT NULL DEFAULT '',
+                price REAL, price_per_m2 REAL, size REAL, rooms INTEGER,
+                floor TEXT, condition TEXT, type TEXT, auction_type TEXT, auction_date TEXT,
+                url TEXT,
+                first_seen REAL NOT NULL, last_seen REAL NOT NULL,
+                lat REAL, lon REAL, geocell INTEGER, description TEXT, terms TEXT, fingerprint TEXT,
+                cluster TEXT
+            );
+        ''')
+        # file creati con uno schema precedente: si aggiungono le colonne mancanti
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(listings)')}
+        for name, kind in ADDED_COLUMNS:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE listings ADD COLUMN {name} {kind}')
+        if 'terms' not in existing:
+            self._fill_terms(conn)
+        if 'fingerprint' not in existing:
+            self._fill_fingerprints(conn)
+        self.fts = self._ensure_fts(conn)
+        # dopo il riempimento dei fingerprint, che altrimenti finirebbe tutto nel change log
+        conn.executescript(CHANGES_SCHEMA)
+        conn.executescript(CLUSTERS_SCHEMA)
+        conn.executescript('''
+            CREATE INDEX IF NOT EXISTS idx_listings_price ON listings (price);
+            CREATE INDEX IF NOT EXISTS idx_listings_size ON listings (size);
+            CREATE INDEX IF NOT EXISTS idx_listings_ppm ON listings (price_per_m2);
+            DROP INDEX IF EXISTS idx_listings_location;
+            CREATE INDEX IF NOT EXISTS idx_listings_last_seen ON listings (last_seen);
+            CREATE INDEX IF NOT EXISTS idx_listings_geocell ON listings (geocell);
+        ''')
+        conn.commit()
+
+    @staticmethod
+    def _fill_terms(conn: sqlite3.Connection) -> None:
+        rows = conn.execute('SELECT rowid, title, description, type, condition FROM listings').fetchall()
+        conn.executemany('UPDATE listings SET terms = ? WHERE rowid = ?', [
+            (' '.join(document_terms(dict(zip(('title', 'description', 'type', 'condition'), row[1:])))), row[0])
+            for row in rows])
+
+    @staticmethod
+    def _fill_fingerprints(conn: sqlite3.Connection) -> None:
+        rows = conn.execute(f"SELECT rowid, {', '.join(CONTENT_COLUMNS)} FROM listings").fetchall()
+        conn.executemany('UPDATE listings SET fingerprint = ? WHERE rowid = ?',
+                         [(fingerprint(row[1:]), row[0]) for row in rows])
+
+    @staticmethod
+    def _ensure_fts(conn: sqlite3.Connection) -> bool:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'listings_fts'").fetchone():
+            return True
+        try:
+            conn.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            # SQLite compilato senza FTS5: la query testuale filtra in Python
+            print(f"[index] FTS5 non disponibile ({e}): ricerca testuale senza indice")
+            return False
+        return True
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def upsert_many(self, source: str, properties: List[Dict], base_url: str = '') -> int:
+        now = time.time()
+        rows = []
+        for prop in properties:
+            point = geocode(prop.get('location'))
+            lat, lon = point if point else (None, None)
+            content = (
+                prop.get('title'), prop.get('location') or '', prop.get('price') or 0.0,
+                prop.get('price_per_m2'), prop.get('size') or 0.0, prop.get('rooms') or 0,
+                prop.get('floor'), prop.get('condition'), prop.get('type'), prop.get('auction_type'),
+                prop.get('auction_date'), prop.get('url'), prop.get('description') or '',
+            )
+            rows.append((
+                listing_key(source, prop, base_url), source, _normalize_location(prop.get('location')),
+                *content, now, now, lat, lon, geocell(lat, lon) if point else None,
+                ' '.join(document_terms(prop)), fingerprint(content),
+            ))
+        conn = self._conn()
+        conn.executemany(f'''
+            INSERT INTO listings (key, source, location_norm, {', '.join(CONTENT_COLUMNS)},
+                                  first_seen, last_seen, lat, lon, geocell, terms, fingerprint)
+            VALUES ({', '.join('?' * (len(CONTENT_COLUMNS) + 10))})
+            ON CONFLICT(key) DO UPDATE SET
+                title=excluded.title, location=excluded.location, location_norm=excluded.location_norm,
+                price=excluded.price, price_per_m2=excluded.price_per_m2, size=excluded.size,
+                rooms=excluded.rooms, floor=excluded.floor, condition=excluded.condition,
+                type=excluded.type, auction_type=excluded.auction_type,
+                auction_date=excluded.auction_date, url=excluded.url, last_seen=excluded.last_seen,
+                lat=excluded.lat, lon=excluded.lon, geocell=excluded.geocell,
+                description=excluded.description, terms=excluded.terms,
+                fingerprint=excluded.fingerprint
+        ''', rows)
+        conn.commit()
+        return len(rows)
+
+    def prune(self, older_than: float, source: Optional[str] = None) -> int:
+        """Rimuove gli annunci (della fonte, se indicata) non più visti dal crawler dopo il timestamp"""
+        conn = self._conn()
+        if source is None:
+            cur = conn.execute('DELETE FROM listings WHERE last_seen < ?', (older_than,))
+        else:
+            cur = conn.execute('DELETE FROM listings WHERE source = ? AND last_seen < ?', (source, older_than))
+        # il change log copre la stessa finestra dell'indice
+        conn.execute('DELETE FROM listing_changes WHERE changed_at < ?', (older_than,))
+        conn.commit()
+        return cur.rowcount
+
+    def refresh_clusters(self) -> int:
+        """
+        Raggruppa gli annunci duplicati tra portali (stesse regole di dedup.py) e salva per
+        ogni gruppo il rappresentante, cioè l'annuncio più completo, e la scheda fusa. Le
+        ricerche restituiscono solo i rappresentanti: la deduplicazione costa una volta per
+        giro del crawler invece che a ogni richiesta. Restituisce gli annunci fusi.
+        """
+        conn = self._conn()
+        rows = conn.execute(f"SELECT key, source, cluster, {', '.join(LISTING_FIELDS)} "
+                            f"FROM listings ORDER BY first_seen, key").fetchall()
+        dedup = Deduplicator()
+        groups: List[List[int]] = []
+        records = []
+        for i, row in enumerate(rows):
+            record = dict(zip(LISTING_FIELDS, row[3:]))
+            records.append(record)
+            group = dedup.assign(record, row[1])
+            if group == len(groups):
+                groups.append([])
+            groups[group].append(i)
+        updates, clusters = [], []
+        for group, members in enumerate(groups):
+            cluster = None
+            if len(members) > 1:
+                # a parità di completezza vince l'annuncio visto per primo
+                cluster = rows[max(members, key=lambda i: richness(records[i]))][0]
+                merged = dedup.records[group]
+                clusters.append((cluster, *(merged[f] for f in LISTING_FIELDS)))
+            updates.extend((cluster, rows[i][0]) for i in members if rows[i][2] != cluster)
+        conn.executemany('UPDATE listings SET cluster = ? WHERE key = ?', updates)
+        conn.execute('DELETE FROM listing_clusters')
+        conn.executemany(f"INSERT INTO listing_clusters (key, {', '.join(LISTING_FIELDS)}) "
+                         f"VALUES ({', '.join('?' * (len(LISTING_FIELDS) + 1))})", clusters)
+        conn.commit()
+        return dedup.merged
+
+    def last_change(self) -> int:
+        """Ultimo numero di sequenza assegnato nel change log (0 se vuoto)"""
+        row = self._conn().execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'listing_changes'").fetchone()
+        return row[0] if row else 0
+
+    def count(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM listings').fetchone()[0]
+
+    def search(self, max_price: Optional[float] = None, min_size: Optional[float] = None,
+               location: Optional[str] = None, max_price_per_m2: Optional[float] = None,
+               limit: Optional[int] = None, radius_km: Optional[float] = None,
+               q: Optional[str] = None) -> List[Dict]:
+        """
+        Stessa semantica dei filtri dei parser: i campi mancanti (0 o vuoti) non escludono
+        l'annuncio e la località è cercata come sottostringa, senza distinguere maiuscole;
+        con radius_km è il centro di una ricerca per distanza (se è nel gazetteer).
+        Con q restano gli annunci che contengono almeno una delle parole cercate.
+        """
+        rows = self._select(max_price, min_size, location, max_price_per_m2, limit, radius_km, q)
+        return [dict(zip(LISTING_FIELDS, row)) for row in rows]
+
+    def search_columns(self, max_price: Optional[float] = None, min_size: Optional[float] = None,
+                       location: Optional[str] = None, max_price_per_m2: Optional[float] = None,
+                       limit: Optional[int] = None, radius_km: Optional[float] = None,
+                       q: Optional[str] = None, changed: Optional[Tuple[int, int]] = None) -> ListingColumns:
+        """
+        Come search, ma in forma colonnare: compatta e ordinabile senza creare dizionari.
+        Con changed=(da, a) solo gli annunci nuovi o cambiati tra le due posizioni del change log.
+        """
+        rows = self._select(max_price, min_size, location, max_price_per_m2, limit, radius_km, q, changed)
+        return ListingColumns(Listing(*row) for row in rows)
+
+    def _select(self, max_price: Optional[float], min_size: Optional[float], location: Optional[str],
+                max_price_per_m2: Optional[float], limit: Optional[int],
+                radius_km: Optional[float] = None, q: Optional[str] = None,
+                changed: Optional[Tuple[int, int]] = None):
+        terms = query_terms(q)
+        # senza FTS5 le parole si verificano in Python: il LIMIT va applicato dopo
+        filter_terms = bool(terms) and not self.fts
+        where, args = self._filters(max_price, min_size, max_price_per_m2, terms, changed)
+        center = geocode(location) if location and radius_km else None
+        if center is not None:
+            rows = self._select_radius(where, args, location, center, radius_km)
+        else:
+            if location:
+                where.append(self._LOCATION_MATCH)
+                args.append(_normalize_location(location))
+            sql = self._merged_sql(where)
+            if limit and not filter_terms:
+                sql += ' LIMIT ?'
+                args.append(int(limit))
+                limit = None
+            rows = self._conn().execute(sql, args)
+        if filter_terms:
+            rows = (row for row in rows if matches(dict(zip(LISTING_FIELDS, row)), terms))
+        return islice(rows, int(limit)) if limit else rows
+
+    def _select_radius(self, where: List[str], args: List, location: str,
+                       center: Tuple[float, float], radius_km: float):
+        """
+        Candidati dalle celle di griglia che coprono il cerchio (un intervallo di celle per
+        riga, cioè un BETWEEN sull'indice), poi distanza esatta. Gli annunci senza
+        coordinate restano soggetti al confronto testuale sulla località.
+        """
+        spatial = []
+        for first, last in cell_ranges(center, radius_km):
+            spatial.append('geocell BETWEEN ? AND ?')
+            args.extend([first, last])
+        spatial.append(f'(geocell IS NULL AND {self._LOCATION_MATCH})')
+        args.append(_normalize_location(location))
+        where.append('(' + ' OR '.join(spatial) + ')')
+        sql = self._merged_sql(where, ('lat', 'lon'))
+        return (row[:-2] for row in map(tuple, self._conn().execute(sql, args))
+                if row[-2] is None or haversine_km(center, row[-2:]) <= radius_km)
+
+    @staticmethod
+    def _merged_sql(where: List[str], extra: Tuple[str, ...] = ()) -> str:
+        """
+        Solo i rappresentanti dei gruppi di duplicati, con la scheda fusa del gruppo al posto
+        della propria (join sulla chiave primaria di listing_clusters)
+        """
+        where = where + ['(cluster IS NULL OR cluster = key)']
+        inner = f"SELECT key, {', '.join(LISTING_FIELDS + extra)} FROM listings WHERE {' AND '.join(where)}"
+        columns = [f'COALESCE(m.{f}, l.{f})' for f in LISTING_FIELDS] + [f'l.{c}' for c in extra]
+        return f"SELECT {', '.join(columns)} FROM ({inner}) l LEFT JOIN listing_clusters m ON m.key = l.key"
+
+    def _filters(self, max_price: Optional[float], min_size: Optional[float],
+                 max_price_per_m2: Optional[float], terms: Tuple[str, ...] = (),
+                 changed: Optional[Tuple[int, int]] = None) -> Tuple[List[str], List]:
+        where, args = [], []
+        if changed is not None:
+            # intervallo sulla chiave primaria del change log: costo proporzionale alle modifiche
+            where.append('key IN (SELECT key FROM listing_changes WHERE seq > ? AND seq <= ?)')
+            args.extend(changed)
+        if max_price:
+            where.append('(price <= ? OR price = 0)')
+            args.append(max_price)
+        if min_size:
+            where.append('(size >= ? OR size = 0)')
+            args.append(min_size)
+        if max_price_per_m2:
+            where.append('(price_per_m2 <= ? OR price_per_m2 IS NULL)')
+            args.append(max_price_per_m2)
+        if terms and self.fts:
+            where.append('rowid IN (SELECT rowid FROM listings_fts WHERE listings_fts MATCH ?)')
+            args.append(fts_query(terms))
+        return where, args
+
+
+class ListingCrawler:
+    """Aggiorna periodicamente l'indice scaricando l'elenco completo di ogni fonte"""
+
+    def __init__(self, index: ListingIndex, scraper: Optional[IVGScraper] = None,
+                 interval: float = 900, max_age: Optional[float] = None, max_pages: int = 20,
+                 parse_workers: int = 0, fetch_workers: int = 8, parse_queue: Optional[int] = None,
+                 polite_delay: Optional[float] = None):
+        self.index = index
+        self.interval = interval
+        # profondità di paginazione per fonte: il crawler scarica l'elenco completo
+        self.max_pages = max_pages
+        # un annuncio sparito da tutte le pagine per 3 giri viene rimosso
+        self.max_age = max_age if max_age is not None else interval * 3
+        # parse_workers > 0: download nei thread (fetch_workers per fonte), parsing in un pool di processi;
+        # polite_delay: secondi tra due richieste allo stesso host (None = quello dello scraper)
+        if scraper is None and (parse_workers > 0 or polite_delay is not None):
+            options = {'page_workers': fetch_workers} if parse_workers > 0 else {}
+            if polite_delay is not None:
+                options['polite_delay'] = polite_delay
+            scraper = IVGScraper(**options)
+        self.scraper = scraper or get_shared_scraper()
+        self.parse_pool: Optional[ParsePool] = None
+        if parse_workers > 0:
+            self.parse_pool = ParsePool(parse_workers, max_pending=parse_queue,
+                                        parser=self.scraper.parser,
+                                        targeted_parsing=self.scraper.targeted_parsing)
+            self.scraper.parse_pool = self.parse_pool
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def crawl_once(self) -> int:
+        started = time.time()
+        total = 0
+        # nessun filtro: scarichiamo l'elenco completo e filtriamo in locale
+        filters = {
+            'max_price': None, 'min_size': None, 'location': None,
+            'home_apartment': None, 'locazione': None, 'stato': None,
+        }
+        # fonti in parallelo (host diversi); le scritture sull'indice restano in questo thread
+        with ThreadPoolExecutor(max_workers=len(self.scraper.SOURCES),
+                                thread_name_prefix='ivg-crawl') as executor:
+            futures = {executor.submit(self.scraper._scrape_source_safe, source, filters,
+                                       max_pages=self.max_pages): source
+                       for source in self.scraper.SOURCES}
+            crawled = []
+            for future in as_completed(futures):
+                source = futures[future]
+                properties = future.result()
+                if properties:
+                    total += self.index.upsert_many(source['name'], properties, source['base_url'])
+                    crawled.append(source['name'])
+        # una fonte fallita o a circuito aperto restituisce []: i suoi annunci restano finché
+        # non torna a rispondere, invece di sparire dopo max_age
+        removed = sum(self.index.prune(started - self.max_age, name) for name in crawled)
+        merged = self.index.refresh_clusters()
+        metrics.DUPLICATES.inc(merged, stage='index')
+        print(f"[crawler] Indicizzati {total} annunci, rimossi {removed}, "
+              f"{merged} duplicati tra portali in {time.time() - started:.1f}s")
+        return total
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.crawl_once()
+            except Exception as e:
+                print(f"[crawler] Errore durante il crawl: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> threading.Thread:
+        self._thread = threading.Thread(target=self.run_forever, name='ivg-crawler', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self.parse_pool is not None:
+            self.parse_pool.close()
+
+
+def index_from_env() -> Optional[ListingIndex]:
+    """IVG_SEARCH_BACKEND=index attiva l'indice locale (file in IVG_INDEX_PATH)"""
+    if os.environ.get('IVG_SEARCH_BACKEND', 'live').lower() != 'index':
+        return None
+    return ListingIndex(os.environ.get('IVG_INDEX_PATH', 'listings.sqlite3'))
+
+
+def parse_workers_from_env() -> int:
+    """IVG_PARSE_WORKERS: numero di processi di parsing, 'auto' = uno per core, 0 = nei thread"""
+    value = os.environ.get('IVG_PARSE_WORKERS', '0').strip().lower()
+    return default_workers() if value == 'auto' else int(value)
+
+
+def crawler_from_env(index: ListingIndex) -> ListingCrawler:
+    queue = os.environ.get('IVG_PARSE_QUEUE')
+    polite_delay = os.environ.get('IVG_CRAWL_POLITE_DELAY')
+    return ListingCrawler(index,
+                          interval=float(os.environ.get('IVG_CRAWL_INTERVAL', 900)),
+                          max_pages=int(os.environ.get('IVG_CRAWL_MAX_PAGES', 20)),
+                          parse_workers=parse_workers_from_env(),
+                          fetch_workers=int(os.environ.get('IVG_CRAWL_FETCH_WORKERS', 8)),
+                          parse_queue=int(queue) if queue else None,
+                          polite_delay=float(polite_delay) if polite_delay else None)
+
+
+if __name__ == "__main__":
+    # processo crawler dedicato (es. riga "worker" del Procfile)
+    index = ListingIndex(os.environ.get('IVG_INDEX_PATH', 'listings.sqlite3'))
+    crawler = crawler_from_env(index)
+    print(f"[crawler] Avvio, intervallo {crawler.interval:.0f}s, indice {index.path}")
+    crawler.run_forever()
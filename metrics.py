@@ -0,0 +1,227 @@
+"""
+IVG Real Estate - Metriche
+Contatori e istogrammi in-process per scraper e API, esposti in formato testo Prometheus
+su /api/metrics. I valori sono per processo: con più worker gunicorn ogni worker
+espone i propri.
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self, **labels) -> float:
+        """Somma dei valori che corrispondono alle etichette indicate"""
+        with self._lock:
+            items = list(self._values.items())
+        return sum(value for key, value in items
+                   if all(key[self.labelnames.index(k)] == str(v) for k, v in labels.items()))
+
+    def drain(self) -> Dict[Tuple[str, ...], float]:
+        """Valori accumulati finora, azzerando il contatore (incrementi da inoltrare a un altro processo)"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: Dict[Tuple[str, ...], float]) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # per etichette: [conteggi per bucket..., somma, conteggio]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in items:
+            for bound, count in zip(self.buckets, state):
+                le = f'le="{_format_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_number(round(state[-2], 6))}')
+            lines.append(f'{self.name}_count{labels} {state[-1]}')
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}')
+        return lines
+
+
+class GaugeFunction:
+    """Gauge calcolato al momento dell'esportazione"""
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge',
+                f'{self.name} {_format_number(self.func())}']
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def drain_counters(self) -> Dict[str, Dict[Tuple[str, ...], float]]:
+        """Incrementi dei contatori dall'ultima chiamata, per nome (processi di parsing -> principale)"""
+        drained = {}
+        for metric in self._metrics:
+            if isinstance(metric, Counter):
+                values = metric.drain()
+                if values:
+                    drained[metric.name] = values
+        return drained
+
+    def merge_counters(self, drained: Dict[str, Dict[Tuple[str, ...], float]]) -> None:
+        for metric in self._metrics:
+            if isinstance(metric, Counter) and metric.name in drained:
+                metric.merge(drained[metric.name])
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# scraper
+SOURCE_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'ivg_source_request_seconds', 'Latenza delle richieste HTTP verso i portali', ['source']))
+SOURCE_RESPONSES = REGISTRY.register(Counter(
+    'ivg_source_responses_total', 'Risposte dei portali per codice HTTP o tipo di errore', ['source', 'status']))
+SOURCE_DEADLINE_EXCEEDED = REGISTRY.register(Counter(
+    'ivg_source_deadline_exceeded_total', 'Fonti ignorate perché oltre la deadline della ricerca', ['source']))
+PARSE_PATH = REGISTRY.register(Counter(
+    'ivg_parse_path_total', 'Pagine analizzate per metodo di estrazione (json, html, none)', ['source', 'path']))
+CARDS = REGISTRY.register(Counter(
+    'ivg_cards_total', 'Card HTML trovate, per esito (parsed, dropped)', ['source', 'outcome']))
+LISTINGS = REGISTRY.register(Counter(
+    'ivg_listings_total', 'Annunci estratti, per esito dei filtri (kept, filtered)', ['source', 'outcome']))
+DUPLICATES = REGISTRY.register(Counter(
+    'ivg_duplicates_merged_total', 'Annunci fusi con un duplicato già visto (aggregate, index)', ['stage']))
+SOURCE_CIRCUIT_STATE = REGISTRY.register(Gauge(
+    'ivg_source_circuit_state', 'Stato del circuit breaker (0 closed, 1 half-open, 2 open)', ['source']))
+SOURCE_SKIPPED = REGISTRY.register(Counter(
+    'ivg_source_skipped_total', 'Ricerche in cui la fonte è stata saltata a circuito aperto', ['source']))
+SOURCE_TIMEOUT_SECONDS = REGISTRY.register(Gauge(
+    'ivg_source_timeout_seconds', 'Timeout adattivo corrente per fonte', ['source']))
+HEDGED_REQUESTS = REGISTRY.register(Counter(
+    'ivg_hedged_requests_total', 'Richieste di riserva (sent) e quelle arrivate per prime (won)', ['source', 'outcome']))
+PARSE_QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'ivg_parse_queue_wait_seconds', 'Attesa dei thread di download per un posto nella coda di parsing',
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)))
+
+# cache
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'ivg_cache_requests_total', 'Ricerche servite per esito della cache (hit, stale, miss)', ['result']))
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    'ivg_coalesced_requests_total',
+    'Ricerche live per ruolo nella coalescenza (leader, follower, shared_cache)', ['role']))
+
+
+def _cache_hit_ratio() -> float:
+    total = CACHE_REQUESTS.total()
+    if not total:
+        return 0.0
+    return round((CACHE_REQUESTS.total(result='hit') + CACHE_REQUESTS.total(result='stale')) / total, 4)
+
+
+CACHE_HIT_RATIO = REGISTRY.register(GaugeFunction(
+    'ivg_cache_hit_ratio', 'Quota di ricerche servite dalla cache (hit + stale)', _cache_hit_ratio))
+
+# API
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    'ivg_http_requests_total', 'Richieste HTTP servite dall\'API', ['endpoint', 'method', 'status']))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'ivg_http_request_seconds', 'Durata delle richieste HTTP servite dall\'API', ['endpoint']))
+HTTP_RESPONSE_BYTES = REGISTRY.register(Counter(
+    'ivg_http_response_bytes_total', 'Byte dei corpi di risposta inviati, per codifica (identity, gzip, br)',
+    ['encoding']))
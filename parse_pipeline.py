@@ -0,0 +1,102 @@
+"""
+IVG Real Estate - Pipeline di parsing multi-processo
+Nei crawl massivi il collo di bottiglia è il parsing HTML (CPU, tenuto dal GIL): i thread
+di download restano nel processo principale e consegnano il contenuto delle pagine a un
+pool di processi che restituisce gli annunci già estratti. La coda verso il pool è
+limitata: se i processi non tengono il passo i thread di download si fermano
+(backpressure) invece di accumulare pagine in memoria.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+
+import metrics
+from listing import Listing
+
+_worker_scraper = None
+
+
+def _init_worker(parser: str, targeted_parsing: bool) -> None:
+    """Uno scraper per processo (solo per il parsing) e gazetteer caricato in anticipo"""
+    global _worker_scraper
+    from geo import get_gazetteer
+    from ivg_scraper import IVGScraper
+    _worker_scraper = IVGScraper(parser=parser, targeted_parsing=targeted_parsing)
+    get_gazetteer()
+
+
+def _analyze_in_worker(content: bytes, base_url: str, source_name: str, page_url: str):
+    properties, links = _worker_scraper._analyze(content, base_url, source_name, page_url)
+    # le metriche del parsing (percorso, card) tornano al processo principale con il risultato
+    return properties, links, metrics.REGISTRY.drain_counters()
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+class ParsePool:
+    """
+    Pool di processi per il parsing delle pagine, con al più `max_pending` pagine in coda
+    o in lavorazione. analyze() ha la stessa firma di IVGScraper._analyze: basta assegnare
+    il pool a scraper.parse_pool.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 parser: str = 'auto', targeted_parsing: bool = True):
+        self.workers = workers or default_workers()
+        self.max_pending = max_pending or self.workers * 2
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._initargs = (parser, targeted_parsing)
+        self._executor_lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: i processi non ereditano i thread e i lock del processo principale
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=self._initargs,
+        )
+
+    def analyze(self, content: bytes, base_url: str, source_name: str,
+                page_url: str) -> Tuple[List[Listing], List[str]]:
+        started = time.perf_counter()
+        with self._slots:
+            metrics.PARSE_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - started)
+            executor = self._executor
+            try:
+                future = executor.submit(_analyze_in_worker, content, base_url, source_name, page_url)
+                properties, links, counters = future.result()
+            except BrokenProcessPool:
+                # un processo è morto (OOM, crash del parser): il pool non accetta più lavoro,
+                # se ne crea uno nuovo e la pagina si riprova una volta
+                executor = self._replace_executor(executor)
+                future = executor.submit(_analyze_in_worker, content, base_url, source_name, page_url)
+                properties, links, counters = future.result()
+        metrics.REGISTRY.merge_counters(counters)
+        return properties, links
+
+    def _replace_executor(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """Sostituisce il pool interrotto (una volta sola anche se lo scoprono più thread)"""
+        with self._executor_lock:
+            if self._executor is broken:
+                print("[parse] Pool di processi interrotto, ne avvio uno nuovo")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+            return self._executor
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> 'ParsePool':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,206 @@
+"""
+IVG Real Estate - Profilazione delle ricerche
+Modalità opzionale, per singola richiesta (?profile=1 o header X-IVG-Profile su /api/search):
+tempi e blocchi di memoria allocati per fase (rete, costruzione del BeautifulSoup, JSON
+embedded, card, classifica...) restituiti nell'header Server-Timing. Con IVG_PROFILE_DIR
+impostata, ?profile=cprofile e ?profile=memory salvano anche un profilo cProfile
+(.prof, leggibile con pstats o snakeviz) e uno snapshot tracemalloc (.tracemalloc).
+Senza una profilazione attiva stage() e bind() non misurano nulla.
+"""
+
+import cProfile
+import contextvars
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# frame salvati per ogni allocazione negli snapshot tracemalloc
+TRACEMALLOC_FRAMES = 10
+
+_current: contextvars.ContextVar = contextvars.ContextVar('ivg_profile', default=None)
+
+# tracemalloc è globale al processo: resta attivo finché c'è una richiesta che lo usa
+# (e non viene fermato se era già attivo, ad esempio con PYTHONTRACEMALLOC)
+_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+_dump_seq = 0
+
+
+def profiling_enabled() -> bool:
+    """IVG_PROFILING=off ignora le richieste di profilazione"""
+    return os.environ.get('IVG_PROFILING', 'on').lower() not in ('0', 'off', 'false', 'no')
+
+
+def profile_dir() -> Optional[str]:
+    """Cartella dei profili cProfile/tracemalloc (None = nessun file su disco)"""
+    return os.environ.get('IVG_PROFILE_DIR') or None
+
+
+class Profile:
+    """
+    Fasi di una richiesta: per ciascuna secondi, chiamate e blocchi allocati (netti, di
+    tutto il processo: indicativi se ci sono altre richieste in corso). Le fasi eseguite
+    in parallelo nei thread dello scraper sommano i tempi dei thread.
+    """
+
+    def __init__(self, cprofile: bool = False, memory: bool = False):
+        self.started = time.perf_counter()
+        self.cprofile = cprofile
+        self.memory = memory
+        self.stages: Dict[str, List[float]] = {}  # nome -> [secondi, chiamate, blocchi]
+        self._lock = threading.Lock()
+        self._profilers: List[cProfile.Profile] = []
+        self._main_profiler: Optional[cProfile.Profile] = None
+
+    def record(self, name: str, seconds: float, blocks: int = 0) -> None:
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = [0.0, 0, 0]
+            stage[0] += seconds
+            stage[1] += 1
+            stage[2] += blocks
+
+    def start_profiler(self) -> Optional[cProfile.Profile]:
+        """Avvia cProfile nel thread corrente (un profilo per thread, uniti nel dump)"""
+        if not self.cprofile:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python >= 3.12: un solo profiler attivo per processo, il thread resta senza cProfile
+            return None
+        return profiler
+
+    def stop_profiler(self, profiler: Optional[cProfile.Profile]) -> None:
+        if profiler is None:
+            return
+        profiler.disable()
+        with self._lock:
+            self._profilers.append(profiler)
+
+    def server_timing(self) -> str:
+        """Valore dell'header Server-Timing (durate in millisecondi), con il totale in fondo"""
+        with self._lock:
+            stages = [(name, list(stage)) for name, stage in self.stages.items()]
+        parts = [f'{name};dur={seconds * 1000:.1f};desc="{int(calls)}x {int(blocks):+d} blocks"'
+                 for name, (seconds, calls, blocks) in stages]
+        parts.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(parts)
+
+    def dump(self, label: str) -> List[str]:
+        """Salva i profili richiesti in IVG_PROFILE_DIR e restituisce i file scritti"""
+        directory = profile_dir()
+        if directory is None:
+            return []
+        global _dump_seq
+        with _lock:
+            _dump_seq += 1
+            seq = _dump_seq
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f'{label}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{seq}')
+        paths = []
+        # snapshot prima di pstats: le allocazioni del dump non finiscono nello snapshot
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.take_snapshot().dump(base + '.tracemalloc')
+            paths.append(base + '.tracemalloc')
+        with self._lock:
+            profilers = list(self._profilers)
+        if profilers:
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(base + '.prof')
+            paths.append(base + '.prof')
+        return paths
+
+
+def parse_mode(value: Optional[str]) -> Optional[Profile]:
+    """
+    Profilo per il valore di ?profile= o X-IVG-Profile: 1/true (solo tempi), cprofile,
+    memory (tracemalloc), all; più modalità separate da virgole. None = nessuna profilazione.
+    """
+    if not value or not profiling_enabled():
+        return None
+    modes = {mode.strip().lower() for mode in str(value).split(',')}
+    if modes & {'0', 'false', 'no', 'off'}:
+        return None
+    dumps = profile_dir() is not None
+    return Profile(cprofile=dumps and bool(modes & {'cprofile', 'all'}),
+                   memory=dumps and bool(modes & {'memory', 'tracemalloc', 'all'}))
+
+
+def current() -> Optional[Profile]:
+    return _current.get()
+
+
+def activate(profile: Profile):
+    """Rende attivo il profilo nel contesto corrente; restituisce il token per deactivate()"""
+    global _tracemalloc_users, _tracemalloc_owned
+    if profile.memory:
+        with _lock:
+            if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                _tracemalloc_owned = True
+            _tracemalloc_users += 1
+    token = _current.set(profile)
+    profile._main_profiler = profile.start_profiler()
+    return token
+
+
+def deactivate(profile: Profile, token, label: str = 'search') -> List[str]:
+    """Chiude il profilo: ferma cProfile, salva i dump e rilascia tracemalloc"""
+    global _tracemalloc_users, _tracemalloc_owned
+    profile.stop_profiler(profile._main_profiler)
+    _current.reset(token)
+    try:
+        return profile.dump(label)
+    finally:
+        if profile.memory:
+            with _lock:
+                _tracemalloc_users -= 1
+                if _tracemalloc_users == 0 and _tracemalloc_owned:
+                    tracemalloc.stop()
+                    _tracemalloc_owned = False
+
+
+@contextmanager
+def stage(name: str):
+    """Misura il blocco come fase `name` del profilo attivo (nessun costo senza profilo)"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    blocks = sys.getallocatedblocks()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.record(name, time.perf_counter() - started, sys.getallocatedblocks() - blocks)
+
+
+def bind(func: Callable) -> Callable:
+    """
+    func con il profilo attivo anche nei thread dei pool (i ThreadPoolExecutor non
+    ereditano il contesto di chi li usa). Senza profilo restituisce func invariata.
+    """
+    profile = _current.get()
+    if profile is None:
+        return func
+
+    def run(*args, **kwargs):
+        token = _current.set(profile)
+        profiler = profile.start_profiler()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.stop_profiler(profiler)
+            _current.reset(token)
+    return run
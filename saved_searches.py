@@ -0,0 +1,93 @@
+"""
+IVG Real Estate - Ricerche salvate
+Filtri salvati nello stesso file SQLite dell'indice locale, ciascuno con un cursore sul
+change log degli annunci (listing_changes). Il controllo dei nuovi annunci legge solo le
+righe del change log successive al cursore: il costo dipende da quanti annunci sono
+cambiati dall'ultimo controllo, non dalla dimensione del catalogo.
+"""
+
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+from listing import ListingColumns
+from listing_index import ListingIndex
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS saved_searches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL DEFAULT '',
+        params TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        cursor INTEGER NOT NULL,
+        checked_at REAL
+    );
+'''
+
+
+class SavedSearches:
+    def __init__(self, index: ListingIndex):
+        self.index = index
+        conn = index._conn()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    @staticmethod
+    def _as_dict(row) -> Dict:
+        saved = dict(row)
+        saved['params'] = json.loads(saved['params'])
+        return saved
+
+    def create(self, params: Dict, name: str = '') -> Dict:
+        """Salva i filtri: contano come nuovi solo gli annunci cambiati da adesso in poi"""
+        conn = self.index._conn()
+        cur = conn.execute(
+            'INSERT INTO saved_searches (name, params, created_at, cursor) VALUES (?, ?, ?, ?)',
+            (name, json.dumps(params, ensure_ascii=False), time.time(), self.index.last_change()))
+        conn.commit()
+        return self.get(cur.lastrowid)
+
+    def get(self, search_id: int) -> Optional[Dict]:
+        row = self.index._conn().execute('SELECT * FROM saved_searches WHERE id = ?', (search_id,)).fetchone()
+        return self._as_dict(row) if row else None
+
+    def list(self) -> List[Dict]:
+        rows = self.index._conn().execute('SELECT * FROM saved_searches ORDER BY id').fetchall()
+        return [self._as_dict(row) for row in rows]
+
+    def delete(self, search_id: int) -> bool:
+        conn = self.index._conn()
+        cur = conn.execute('DELETE FROM saved_searches WHERE id = ?', (search_id,))
+        conn.commit()
+        return cur.rowcount > 0
+
+    def new_matches(self, search_id: int,
+                    since: Optional[int] = None) -> Optional[Tuple[Dict, ListingColumns, int]]:
+        """
+        (ricerca, annunci, posizione raggiunta nel change log): annunci nuovi o cambiati che
+        corrispondono ai filtri, dal cursore salvato (che poi avanza) oppure dalla posizione
+        `since` indicata (il cursore resta dov'è). None se la ricerca non esiste.
+        """
+        saved = self.get(search_id)
+        if saved is None:
+            return None
+        start = saved['cursor'] if since is None else since
+        # fine dell'intervallo letta prima della query: le modifiche successive restano per il prossimo controllo
+        head = self.index.last_change()
+        params = saved['params']
+        if head > start:
+            matches = self.index.search_columns(max_price=params.get('max_price'),
+                                                min_size=params.get('min_size'),
+                                                location=params.get('location'),
+                                                radius_km=params.get('radius_km'),
+                                                q=params.get('q'), changed=(start, head))
+        else:
+            matches = ListingColumns()
+        if since is None:
+            conn = self.index._conn()
+            # il cursore non torna indietro se due controlli si sovrappongono
+            conn.execute('UPDATE saved_searches SET cursor = MAX(cursor, ?), checked_at = ? WHERE id = ?',
+                         (head, time.time(), search_id))
+            conn.commit()
+            saved = self.get(search_id) or saved
+        return saved, matches, head
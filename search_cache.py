@@ -0,0 +1,244 @@
+"""
+IVG Real Estate - Cache dei risultati di ricerca
+Cache TTL/LRU davanti a IVGScraper.search_properties, con backend in memoria
+oppure su SQLite locale (condivisibile tra i worker gunicorn)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+
+def _normalize_number(value) -> Optional[float]:
+    try:
+        value = float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+    # 0 equivale a "nessun filtro" per lo scraper
+    return value or None
+
+
+def _normalize_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    text = ' '.join(str(value).split()).lower()
+    return text or None
+
+
+def normalize_search_params(max_price=None, min_size=None, location=None,
+                            locazione=None, stato=None, radius_km=None, q=None) -> Tuple:
+    """Tupla (max_price, min_size, location, locazione, stato, radius_km, q) normalizzata, usata come chiave"""
+    return (
+        _normalize_number(max_price),
+        _normalize_number(min_size),
+        _normalize_text(location),
+        _normalize_text(locazione),
+        _normalize_text(stato),
+        _normalize_number(radius_km),
+        _normalize_text(q),
+    )
+
+
+def cache_key(params: Tuple) -> str:
+    return json.dumps(list(params), ensure_ascii=False)
+
+
+def _to_json(value):
+    # risultati colonnari (ListingColumns): salvati nella forma JSON del frontend
+    if hasattr(value, 'to_dicts'):
+        return value.to_dicts()
+    raise TypeError(f"{type(value).__name__} non serializzabile in JSON")
+
+
+class MemoryCache:
+    """Backend in-process: LRU con OrderedDict, protetto da lock"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[Any, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (value, stored_at or time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """
+    Backend su file SQLite: condiviso tra processi, LRU tramite accessed_at. Un hit
+    aggiorna accessed_at solo se è più vecchio di `touch_interval` secondi: le letture
+    frequenti della stessa chiave non prendono il lock di scrittura a ogni richiesta.
+    """
+
+    def __init__(self, path: str = 'search_cache.sqlite3', max_entries: int = 1024,
+                 touch_interval: float = 60.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS search_cache ('
+            ' key TEXT PRIMARY KEY, value TEXT NOT NULL,'
+            ' stored_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_search_cache_accessed ON search_cache (accessed_at)')
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # una connessione per thread: sqlite3 non ama condividerle
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        conn = self._conn()
+        row = conn.execute('SELECT value, stored_at, accessed_at FROM search_cache WHERE key = ?',
+                           (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[2] >= self.touch_interval:
+            conn.execute('UPDATE search_cache SET accessed_at = ? WHERE key = ?', (now, key))
+            conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO search_cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value, ensure_ascii=False, default=_to_json), stored_at or now, now)
+        )
+        conn.execute(
+            'DELETE FROM search_cache WHERE key IN ('
+            ' SELECT key FROM search_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+        conn.commit()
+
+    def clear(self) -> None:
+        conn = self._conn()
+        conn.execute('DELETE FROM search_cache')
+        conn.commit()
+
+
+class SearchCache:
+    """
+    Cache TTL con stale-while-revalidate opzionale.
+    Un risultato più vecchio di `ttl` ma entro `ttl + stale_ttl` viene servito subito
+    e ricalcolato in background.
+    """
+
+    HIT, STALE, MISS = 'hit', 'stale', 'miss'
+
+    def __init__(self, backend, ttl: float = 300, stale_ttl: float = 0):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+
+    def get_or_compute(self, key: str, compute: Callable[[], List]) -> Tuple[List, str]:
+        cached = self.peek(key)
+        if cached is not None:
+            value, status = cached
+            if status == self.STALE:
+                self._refresh_in_background(key, compute)
+            return value, status
+
+        value = compute()
+        self.backend.set(key, value)
+        return value, self.MISS
+
+    def peek(self, key: str) -> Optional[Tuple[List, str]]:
+        """(valore, 'hit' o 'stale') senza ricalcolo; None se assente o oltre la finestra stale"""
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age < self.ttl:
+                return value, self.HIT
+            if age < self.ttl + self.stale_ttl:
+                return value, self.STALE
+        return None
+
+    def lookup(self, key: str) -> Optional[List]:
+        """Valore ancora valido per la chiave, senza ricalcolo (None se assente o scaduto)"""
+        entry = self.backend.get(key)
+        if entry is not None and time.time() - entry[1] < self.ttl:
+            return entry[0]
+        return None
+
+    def store(self, key: str, value: List) -> None:
+        self.backend.set(key, value)
+
+    def claim_refresh(self, key: str) -> bool:
+        """Prenota l'aggiornamento in background della chiave; False se è già in corso"""
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def release_refresh(self, key: str) -> None:
+        with self._refresh_lock:
+            self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key: str, compute: Callable[[], List]) -> None:
+        if not self.claim_refresh(key):
+            return
+
+        def refresh():
+            try:
+                self.backend.set(key, compute())
+            except Exception as e:
+                print(f"[cache] Errore aggiornamento in background: {e}")
+            finally:
+                self.release_refresh(key)
+
+        threading.Thread(target=refresh, name='ivg-cache-refresh', daemon=True).start()
+
+
+def cache_from_env() -> Optional[SearchCache]:
+    """
+    Configurazione da variabili d'ambiente:
+      IVG_CACHE_BACKEND      memory (default) | sqlite | off
+      IVG_CACHE_TTL          secondi di validità (default 300)
+      IVG_CACHE_STALE_TTL    finestra stale-while-revalidate in secondi (default 0 = disattiva)
+      IVG_CACHE_MAX_ENTRIES  numero massimo di ricerche in cache (default 256)
+      IVG_CACHE_PATH         file SQLite per il backend sqlite (default search_cache.sqlite3)
+    """
+    backend_name = os.environ.get('IVG_CACHE_BACKEND', 'memory').lower()
+    if backend_name in ('off', 'none', '0', ''):
+        return None
+    max_entries = int(os.environ.get('IVG_CACHE_MAX_ENTRIES', 256))
+    if backend_name == 'sqlite':
+        backend = SQLiteCache(os.environ.get('IVG_CACHE_PATH', 'search_cache.sqlite3'), max_entries)
+    else:
+        backend = MemoryCache(max_entries)
+    return SearchCache(backend,
+                       ttl=float(os.environ.get('IVG_CACHE_TTL', 300)),
+                       stale_ttl=float(os.environ.get('IVG_CACHE_STALE_TTL', 0)))
@@ -0,0 +1,341 @@
+"""
+IVG Real Estate - Logica di ricerca condivisa
+Parametri, cache, indice locale e classifica usati sia dal server Flask (app.py)
+sia dal server ASGI (asgi_app.py), così i due espongono lo stesso contratto
+"""
+
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import metrics
+from batch_scoring import rank_properties
+from coalescing import AsyncSingleFlight, SingleFlight, coalescing_mode, shared_lock_from_env
+from geo import geocode
+from ivg_scraper import IVGScraper
+from listing import ListingColumns, compact
+from listing_index import crawler_from_env, index_from_env
+from saved_searches import SavedSearches
+from search_cache import SQLiteCache, cache_from_env, cache_key, normalize_search_params
+
+SEARCH_FIELDS = ('max_price', 'min_size', 'location', 'locazione', 'stato', 'radius_km', 'q')
+NUMERIC_FIELDS = ('max_price', 'min_size', 'radius_km')
+
+# cache dei risultati (None se disattivata con IVG_CACHE_BACKEND=off)
+search_cache = cache_from_env()
+
+# indice locale degli annunci (None se IVG_SEARCH_BACKEND=live, default)
+listing_index = index_from_env()
+
+# ricerche salvate: usano il change log dell'indice, quindi solo con IVG_SEARCH_BACKEND=index
+saved_searches = SavedSearches(listing_index) if listing_index is not None else None
+SAVED_SEARCHES_DISABLED = "Le ricerche salvate richiedono l'indice locale (IVG_SEARCH_BACKEND=index)"
+
+# coalescenza delle ricerche identiche in corso (None con IVG_COALESCE=off)
+flight = SingleFlight() if coalescing_mode() != 'off' else None
+async_flight = AsyncSingleFlight() if coalescing_mode() != 'off' else None
+# lock tra worker, solo con IVG_COALESCE=shared e cache SQLite condivisa
+shared_lock = shared_lock_from_env(search_cache is not None and isinstance(search_cache.backend, SQLiteCache))
+
+
+def start_background_crawler() -> None:
+    if listing_index is not None and os.environ.get('IVG_CRAWLER') == 'inprocess':
+        # con più worker gunicorn conviene un processo crawler dedicato (python listing_index.py)
+        crawler_from_env(listing_index).start()
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def params_from_json(data: Optional[Mapping]) -> Dict:
+    """Filtri dal body JSON di una POST"""
+    data = data if isinstance(data, Mapping) else {}
+    params = {field: data.get(field) for field in SEARCH_FIELDS}
+    # il raggio arriva anche come stringa dai form: entra nei calcoli di distanza
+    params['radius_km'] = _number(params['radius_km'])
+    return params
+
+
+def params_from_query(args: Mapping) -> Dict:
+    """Filtri dalla query string di una GET: i numeri non validi valgono None"""
+    params = {}
+    for field in SEARCH_FIELDS:
+        value = args.get(field)
+        if field in NUMERIC_FIELDS:
+            value = _number(value)
+        params[field] = value
+    return params
+
+
+def params_error(params: Dict) -> Optional[str]:
+    """Motivo per cui i filtri non sono utilizzabili (risposta 400), None se sono validi"""
+    if params['radius_km'] and params['location'] and geocode(params['location']) is None:
+        # senza centro la ricerca per raggio diventerebbe un confronto testuale, e nelle
+        # ricerche live la località non viene nemmeno passata ai portali
+        return (f"Località '{params['location']}' non presente nel gazetteer: la ricerca per raggio "
+                f"è disponibile per i capoluoghi di provincia e i comuni più grandi "
+                f"(senza radius_km la località si cerca per nome)")
+    return None
+
+
+def search_key(params: Dict) -> str:
+    return cache_key(normalize_search_params(*(params[field] for field in SEARCH_FIELDS)))
+
+
+def coalesce(key: str, compute: Callable[[], List]) -> List:
+    """
+    Esegue compute una sola volta per le richieste identiche in corso nel worker;
+    con il lock tra worker, chi arriva dopo un altro processo riusa il risultato in cache.
+    """
+    if flight is None:
+        return compute()
+
+    def leader():
+        if shared_lock is None:
+            return compute()
+        handle, cached = _acquire_shared(key)
+        try:
+            if cached is not None:
+                return cached
+            value = compute()
+            # in cache prima di rilasciare il lock: chi lo prende dopo trova già il risultato
+            search_cache.store(key, value)
+            return value
+        finally:
+            shared_lock.release(handle)
+
+    value, shared = flight.do(key, leader)
+    metrics.COALESCED_REQUESTS.inc(role='follower' if shared else 'leader')
+    return value
+
+
+async def coalesce_async(key: str, compute: Callable[[], Awaitable[List]]) -> List:
+    """Come coalesce, per il server ASGI: il lock tra worker si attende in un thread"""
+    if async_flight is None:
+        return await compute()
+
+    async def leader():
+        if shared_lock is None:
+            return await compute()
+        handle, cached = await asyncio.to_thread(_acquire_shared, key)
+        try:
+            if cached is not None:
+                return cached
+            value = await compute()
+            await asyncio.to_thread(search_cache.store, key, value)
+            return value
+        finally:
+            shared_lock.release(handle)
+
+    value, shared = await async_flight.do(key, leader)
+    metrics.COALESCED_REQUESTS.inc(role='follower' if shared else 'leader')
+    return value
+
+
+def coalesce_stream(key: str, iterate: Callable[[], Iterable[Tuple[str, List]]],
+                    aggregate: Callable[[Dict], List]) -> Iterator[Tuple[Optional[str], List]]:
+    """
+    Batch (fonte, annunci) di una ricerca live in streaming, poi (None, risultato aggregato).
+    Come coalesce, con cui condivide le chiavi: le richieste identiche in corso nel worker
+    attendono il leader e ricevono il risultato aggregato in un solo batch 'coalesced'.
+    """
+    call, leader = flight.begin(key) if flight is not None else (None, True)
+    if not leader:
+        aggregated = flight.wait(call)
+        metrics.COALESCED_REQUESTS.inc(role='follower')
+        yield 'coalesced', aggregated
+        yield None, aggregated
+        return
+    if call is not None:
+        metrics.COALESCED_REQUESTS.inc(role='leader')
+
+    streaming = True
+    handle = cached = aggregated = error = None
+    try:
+        if call is not None and shared_lock is not None:
+            handle, cached = _acquire_shared(key)
+        results = {}
+        for source_name, properties in ([('cache', cached)] if cached is not None else iterate()):
+            results[source_name] = properties
+            if streaming:
+                try:
+                    yield source_name, properties
+                except GeneratorExit:
+                    # client disconnesso: la ricerca prosegue per chi la sta attendendo
+                    streaming = False
+        aggregated = cached if cached is not None else aggregate(results)
+        if handle is not None and cached is None:
+            search_cache.store(key, aggregated)
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        if shared_lock is not None:
+            shared_lock.release(handle)
+        if call is not None:
+            flight.finish(key, call, aggregated, error)
+    if streaming:
+        yield None, aggregated
+
+
+async def coalesce_stream_async(key: str, iterate: Callable[[], AsyncIterator[Tuple[str, List]]],
+                                aggregate: Callable[[Dict], List]) -> AsyncIterator[Tuple[Optional[str], List]]:
+    """
+    Come coalesce_stream, per il server ASGI. Lo scraping gira in un task separato che passa
+    i batch da una coda: se il client del leader si disconnette, chi attende riceve comunque il risultato.
+    """
+    batches: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def leader():
+        handle = cached = None
+        try:
+            if async_flight is not None and shared_lock is not None:
+                handle, cached = await asyncio.to_thread(_acquire_shared, key)
+            if cached is not None:
+                batches.put_nowait(('cache', cached))
+                return cached
+            results = {}
+            async for source_name, properties in iterate():
+                results[source_name] = properties
+                batches.put_nowait((source_name, properties))
+            aggregated = aggregate(results)
+            if handle is not None:
+                await asyncio.to_thread(search_cache.store, key, aggregated)
+            return aggregated
+        finally:
+            if shared_lock is not None:
+                shared_lock.release(handle)
+            batches.put_nowait(done)
+
+    if async_flight is None:
+        task, shared = asyncio.ensure_future(leader()), False
+    else:
+        task, shared = async_flight.start(key, leader)
+        metrics.COALESCED_REQUESTS.inc(role='follower' if shared else 'leader')
+    try:
+        if shared:
+            aggregated = await asyncio.shield(task)
+            yield 'coalesced', aggregated
+        else:
+            while True:
+                batch = await batches.get()
+                if batch is done:
+                    break
+                yield batch
+            aggregated = await asyncio.shield(task)
+        yield None, aggregated
+    finally:
+        # senza coalescenza nessuno attende lo scraping di un client disconnesso
+        if async_flight is None:
+            task.cancel()
+
+
+def _acquire_shared(key: str) -> Tuple[Optional[object], Optional[List]]:
+    """Lock tra worker sulla chiave e, se lo aveva un altro processo, il suo risultato in cache"""
+    handle, waited = shared_lock.acquire(key)
+    cached = search_cache.lookup(key) if waited else None
+    if cached is not None:
+        metrics.COALESCED_REQUESTS.inc(role='shared_cache')
+    return handle, cached
+
+
+def search_from_index(params: Dict) -> ListingColumns:
+    # forma colonnare: la classifica crea i dizionari solo per gli annunci restituiti;
+    # i duplicati tra portali sono già raggruppati dal crawler (ListingIndex.refresh_clusters)
+    return listing_index.search_columns(max_price=params['max_price'], min_size=params['min_size'],
+                                        location=params['location'], radius_km=params['radius_km'],
+                                        q=params['q'])
+
+
+def result_limit() -> Optional[int]:
+    # dall'indice possono arrivare migliaia di annunci: ordiniamo solo i migliori
+    return IVGScraper.MAX_RESULTS if listing_index is not None else None
+
+
+def rank(properties: List[Dict], params: Dict, top_k: Optional[int] = None) -> List[Dict]:
+    return rank_properties(properties, params['max_price'], params['min_size'], params['location'],
+                           locazione=params['locazione'], stato=params['stato'], top_k=top_k,
+                           radius_km=params['radius_km'], q=params['q'])
+
+
+def wants_compact(value) -> bool:
+    """Flag compact da query string (?compact=1) o body JSON ("compact": true)"""
+    return value is True or str(value).lower() in ('1', 'true', 'yes')
+
+
+def search_payload(properties: List[Dict], cache_status: str, compact_mode: bool = False) -> Dict:
+    # in modalità compatta gli annunci omettono i campi con il valore di default
+    return {
+        'success': True,
+        'count': len(properties),
+        'cache': cache_status,
+        'properties': [compact(prop) for prop in properties] if compact_mode else properties
+    }
+
+
+def error_payload(error: Exception) -> Dict:
+    return {
+        'success': False,
+        'error': str(error),
+        'properties': []
+    }
+
+
+def create_saved_search(data: Optional[Mapping]) -> Tuple[Dict, int]:
+    """Salva i filtri del body JSON (stessi campi di /api/search, più 'name')"""
+    if saved_searches is None:
+        return error_payload(RuntimeError(SAVED_SEARCHES_DISABLED)), 503
+    params = params_from_json(data)
+    invalid = params_error(params)
+    if invalid:
+        return error_payload(ValueError(invalid)), 400
+    name = str(data.get('name') or '') if isinstance(data, Mapping) else ''
+    return {'success': True, 'search': saved_searches.create(params, name)}, 201
+
+
+def list_saved_searches() -> Tuple[Dict, int]:
+    if saved_searches is None:
+        return error_payload(RuntimeError(SAVED_SEARCHES_DISABLED)), 503
+    return {'success': True, 'searches': saved_searches.list()}, 200
+
+
+def delete_saved_search(search_id: int) -> Tuple[Dict, int]:
+    if saved_searches is None:
+        return error_payload(RuntimeError(SAVED_SEARCHES_DISABLED)), 503
+    if not saved_searches.delete(search_id):
+        return error_payload(LookupError(f'Ricerca salvata {search_id} inesistente')), 404
+    return {'success': True}, 200
+
+
+def saved_search_new(search_id: int, since=None) -> Tuple[Dict, int]:
+    """Nuovi annunci di una ricerca salvata, ordinati per match (il cursore avanza senza ?since=)"""
+    if saved_searches is None:
+        return error_payload(RuntimeError(SAVED_SEARCHES_DISABLED)), 503
+    since = _number(since)
+    result = saved_searches.new_matches(search_id, int(since) if since is not None else None)
+    if result is None:
+        return error_payload(LookupError(f'Ricerca salvata {search_id} inesistente')), 404
+    saved, matches, head = result
+    properties = rank(matches, saved['params'])
+    return {
+        'success': True,
+        'search': saved,
+        # posizione da passare come ?since= per rileggere da qui
+        'cursor': head,
+        'count': len(properties),
+        'properties': properties,
+    }, 200
+
+
+def encode_event(event: Dict, use_sse: bool) -> str:
+    """Un evento dello stream: riga NDJSON oppure messaggio Server-Sent Events"""
+    payload = json.dumps(event, ensure_ascii=False)
+    if use_sse:
+        return f"event: {event['type']}\ndata: {payload}\n\n"
+    return payload + '\n'
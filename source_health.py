@@ -0,0 +1,131 @@
+"""
+IVG Real Estate - Salute delle fonti
+Circuit breaker (closed/open/half-open) e timeout adattivi per ogni portale,
+calcolati dalle latenze osservate
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class SourceHealth:
+    """
+    Stato di una fonte.
+    - closed: le richieste passano; dopo `failure_threshold` errori consecutivi si apre
+    - open: le richieste vengono saltate subito per `reset_timeout` secondi
+    - half-open: passa una sola richiesta di prova; se va bene si richiude, altrimenti si riapre
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 60,
+                 window: int = 50, min_samples: int = 5, timeout_quantile: float = 0.95,
+                 timeout_factor: float = 2.0, min_timeout: float = 2.0,
+                 hedge_quantile: float = 0.9):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_samples = min_samples
+        self.timeout_quantile = timeout_quantile
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self.hedge_quantile = hedge_quantile
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # half-open: una sola richiesta di prova alla volta
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._record_failure()
+
+    def release_probe(self) -> None:
+        """
+        Chiude la prova half-open rimasta senza esito (errore prima o fuori dalla richiesta
+        HTTP, richiesta annullata): conta come errore, altrimenti la fonte resterebbe
+        esclusa per sempre.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probe_in_flight:
+                self._record_failure()
+
+    def _record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                print(f"[health] Circuito aperto per {self.name} "
+                      f"({self.consecutive_failures} errori consecutivi)")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def _quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def timeout(self, max_timeout: float) -> float:
+        """Timeout adattivo: p95 osservato x fattore, tra min_timeout e il timeout configurato"""
+        observed = self._quantile(self.timeout_quantile)
+        if observed is None:
+            return max_timeout
+        return max(self.min_timeout, min(max_timeout, observed * self.timeout_factor))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Dopo quanto lanciare una richiesta di riserva (p90 osservato), None se pochi dati"""
+        return self._quantile(self.hedge_quantile)
+
+    def state_code(self) -> int:
+        return {self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[self.state]
+
+
+class HealthTracker:
+    """Registro thread-safe degli stati per nome fonte"""
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self._sources: Dict[str, SourceHealth] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, **overrides) -> SourceHealth:
+        health = self._sources.get(name)
+        if health is None:
+            with self._lock:
+                health = self._sources.get(name)
+                if health is None:
+                    config = dict(self.defaults)
+                    config.update(overrides)
+                    health = self._sources[name] = SourceHealth(name, **config)
+        return health
+
+    def all(self) -> Dict[str, SourceHealth]:
+        with self._lock:
+            return dict(self._sources)